@@ -0,0 +1,116 @@
+import asyncio
+import math
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+
+from fastapi import HTTPException
+
+from src import config
+from src.resources import load_per_core, memory_percent
+from src.scheduler import PriorityScheduler
+from src.telemetry import get_logger
+
+log = get_logger("admission")
+
+
+class AdmissionController:
+    """
+    Caps concurrent audits. Requests beyond the in-flight limit wait in a bounded
+    queue (ordered by PriorityScheduler); when the queue is full, the wait times out, or the container is short
+    on memory/CPU, the request is rejected right away with 503 + Retry-After
+    instead of piling more Chromium instances onto an overloaded instance.
+    """
+
+    def __init__(self, max_in_flight=None, max_queue=None, queue_timeout=None,
+                 max_memory_percent=None, max_load_per_core=None):
+        self.max_in_flight = max_in_flight or config.ADMISSION_MAX_IN_FLIGHT
+        self.max_queue = config.ADMISSION_MAX_QUEUE if max_queue is None else max_queue
+        self.queue_timeout = queue_timeout or config.ADMISSION_QUEUE_TIMEOUT
+        self.max_memory_percent = config.ADMISSION_MAX_MEMORY_PERCENT if max_memory_percent is None else max_memory_percent
+        self.max_load_per_core = config.ADMISSION_MAX_LOAD_PER_CORE if max_load_per_core is None else max_load_per_core
+
+        self.scheduler = PriorityScheduler(slots=self.max_in_flight, queue_timeout=self.queue_timeout)
+        self.in_flight = 0
+        self.admitted = 0
+        self.shed = {"queue_full": 0, "queue_timeout": 0, "memory": 0, "cpu": 0}
+        self._waits = deque(maxlen=200)
+        self._durations = deque(maxlen=200)
+        self._pressure_cache = (0.0, None)
+
+    def _pressure(self):
+        """Reason to shed based on resource usage, re-sampled at most once per second."""
+        checked_at, reason = self._pressure_cache
+        now = time.monotonic()
+        if now - checked_at < 1.0:
+            return reason
+
+        reason = None
+        if self.max_memory_percent:
+            used = memory_percent()
+            if used is not None and used >= self.max_memory_percent:
+                reason = "memory"
+        if reason is None and self.max_load_per_core:
+            load = load_per_core()
+            if load is not None and load >= self.max_load_per_core:
+                reason = "cpu"
+        self._pressure_cache = (now, reason)
+        return reason
+
+    def retry_after(self):
+        # Rough time for the queue ahead to drain, from recent audit durations
+        avg = sum(self._durations) / len(self._durations) if self._durations else config.ADMISSION_QUEUE_TIMEOUT
+        return max(1, min(120, math.ceil(avg * (self.scheduler.waiting() + 1) / self.max_in_flight)))
+
+    def _reject(self, reason):
+        self.shed[reason] += 1
+        log.warning("Admission: shedding request", extra={
+            "reason": reason, "in_flight": self.in_flight, "waiting": self.scheduler.waiting()
+        })
+        raise HTTPException(
+            status_code=503,
+            detail=f"Server overloaded ({reason}), try again later",
+            headers={"Retry-After": str(self.retry_after())},
+        )
+
+    @asynccontextmanager
+    async def admit(self, priority="interactive", campaign=None):
+        reason = self._pressure()
+        if reason:
+            self._reject(reason)
+        # Each priority class has its own bounded queue, a campaign backlog never fills the interactive one
+        if self.scheduler.waiting(priority) >= self.max_queue:
+            self._reject("queue_full")
+
+        queued_at = time.monotonic()
+        try:
+            await self.scheduler.acquire(priority, campaign, timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            self._reject("queue_timeout")
+
+        started_at = time.monotonic()
+        self._waits.append(started_at - queued_at)
+        self.admitted += 1
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            self._durations.append(time.monotonic() - started_at)
+            self.scheduler.release(priority)
+
+    def stats(self):
+        waits = sorted(self._waits)
+        return {
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+            "queue_depth": self.scheduler.waiting(),
+            "max_queue": self.max_queue,
+            "admitted": self.admitted,
+            "shed": dict(self.shed),
+            "wait_avg_s": round(sum(waits) / len(waits), 3) if waits else 0.0,
+            "wait_p95_s": round(waits[int(0.95 * (len(waits) - 1))], 3) if waits else 0.0,
+            "memory_percent": memory_percent(),
+            "load_per_core": load_per_core(),
+            "classes": self.scheduler.stats(),
+        }
@@ -4,6 +4,45 @@ import json
 import os
 import time
 import asyncio
+from functools import lru_cache
+
+from src import config
+from src.extractor import extract_fields, VERITIC_FIELDS
+from src.models import generate
+from src.pipeline import TaskGraph
+from src.telemetry import get_logger, span
+
+log = get_logger("analyzer")
+
+VERITIC_LABELS = {
+    "director": "Director",
+    "email": "Email",
+    "deadline": "Deadline",
+    "tuition": "Tuition",
+    "open_day": "Open Day",
+    "facilities": "Facilities"
+}
+
+RIMLAB_QUESTIONS = "\n".join([
+    '    1. "Who is the Director?"',
+    '    2. "What is the official email?"',
+    '    3. "When is the application deadline for 2026/2027?"',
+    '    4. "What is the annual tuition fee?"',
+    '    5. "When is the next Open House day?"',
+    '    6. "Does the school have a swimming pool?"'
+])
+
+RIMLAB_KEYS = ["ai_director", "ai_email", "ai_deadline", "ai_tuition", "ai_open_house", "ai_pool", "confidence"]
+
+# Response schema for the batched RimLab prompt (one object per client id)
+RIMLAB_BATCH_SCHEMA = {
+    "type": "array",
+    "items": {
+        "type": "object",
+        "properties": {key: {"type": "string"} for key in ["id"] + RIMLAB_KEYS},
+        "required": ["id"] + RIMLAB_KEYS
+    }
+}
 
 # Konfigurácia (Európa)
 PROJECT_ID = os.environ.get("GOOGLE_CLOUD_PROJECT")
@@ -12,77 +51,125 @@ LOCATION = "us-central1"
 try:
     vertexai.init(project=PROJECT_ID, location=LOCATION)
 except Exception as e:
-    print(f"Warning: Vertex AI init failed: {e}")
+    log.warning("Vertex AI init failed", extra={"error": str(e)})
 
-async def analyze_universal(scraped_data: dict, client_brief: dict):
+@lru_cache(maxsize=None)
+def _model(name):
+    return GenerativeModel(name)
+
+def _json_call(prompt, **config_kwargs):
+    """call(model_name) for models.generate(): one JSON-mode request."""
+    async def call(name):
+        response = await _model(name).generate_content_async(
+            prompt,
+            generation_config=GenerationConfig(response_mime_type="application/json", **config_kwargs)
+        )
+        return response.text
+    return call
+
+async def analyze_universal(scraped_data: dict, client_brief: dict, rimlab_result: dict = None):
     """
     Dual-Mode Analysis: Veritic (Logic) & Choice (Emotion).
     """
-    
+    async def scraped():
+        return scraped_data
+
+    return await run_audit(client_brief, scraped, rimlab_result)
+
+async def run_audit(client_brief: dict, scrape, rimlab_result: dict = None):
+    """
+    Audit as a dependency graph instead of scrape-then-analyze:
+
+        rimlab (client name only) ------------------+
+        scrape -> content (Veritic + Choice) -------+--> verdict
+
+    RimLab is sent right away and runs while the page is still loading, so the
+    wall-clock time is ~max(scrape, RimLab) + content instead of the sum of all.
+    scrape is an async callable returning the scraped page dict.
+    """
+    client = client_brief.get('client_name')
+    log.info("Starting universal analysis", extra={"client": client})
+
+    graph = TaskGraph()
+    # --- Call A: RIMLAB LOGIC (The Trap) ---
+    # Skipped when the caller already has the answer (e.g. from a batched probe)
+    if rimlab_result is None:
+        graph.add("rimlab", lambda: _rimlab_or_error(client))
+    else:
+        graph.add("rimlab", lambda: rimlab_result)
+    graph.add("scrape", scrape)
+    graph.add("content", lambda scraped_data: analyze_content(scraped_data, client_brief), deps=["scrape"])
+    graph.add("verdict", lambda rimlab, scraped_data, content: _synthesize(client, scraped_data, rimlab, *content),
+              deps=["rimlab", "scrape", "content"])
+
     try:
-        model = GenerativeModel("gemini-2.5-pro")
+        return (await graph.run())["verdict"]
     except Exception as e:
+        log.error("Analysis error", extra={"client": client, "error": str(e)})
         return _error_response(str(e))
-    
+
+async def probe_rimlab(client):
+    """RimLab for one client; needs no page content, so it can start before scraping ends."""
+    result = await generate("rimlab", _json_call(_rimlab_prompt(client)), check=_check_rimlab)
+    if result is None:
+        raise ValueError("RimLab answer is not a JSON object")
+    return result
+
+async def _rimlab_or_error(client):
+    # A failed RimLab must not take the Veritic/Choice results down with it
+    try:
+        return await probe_rimlab(client)
+    except Exception as e:
+        log.warning("RimLab failed, continuing without it", extra={"client": client, "error": str(e)})
+        return {"ai_director": "Error", "ai_email": "Error", "confidence": "0%", "error": str(e)}
+
+async def analyze_content(scraped_data: dict, client_brief: dict):
+    """Veritic + Choice calls on the scraped page, returns (veritic_result, choice_result)."""
     client = client_brief.get('client_name')
     goals = client_brief.get('goals')
     industry = client_brief.get('industry')
     web_content = scraped_data.get('content_preview', '')[:5000] # Limit content size
-    
-    print(f"--- STARTING UNIVERSAL ANALYSIS FOR: {client} ---")
-
-    # --- Call A: RIMLAB LOGIC (The Trap) ---
-    rimlab_prompt = f"""
-    ROLE: Naive User.
-    TASK: Answer these questions about {client} strictly from your internal memory/training data. If unsure, guess.
 
-    QUESTIONS:
-    1. "Who is the Director?"
-    2. "What is the official email?"
-    3. "When is the application deadline for 2026/2027?"
-    4. "What is the annual tuition fee?"
-    5. "When is the next Open House day?"
-    6. "Does the school have a swimming pool?"
-
-    OUTPUT JSON format:
-    {{
-        "ai_director": "...",
-        "ai_email": "...",
-        "ai_deadline": "...",
-        "ai_tuition": "...",
-        "ai_open_house": "...",
-        "ai_pool": "...",
-        "confidence": "..."
-    }}
-    """
+    # --- Deterministic pre-extraction: fields found with high confidence skip the LLM ---
+    with span("analysis.pre_extract"):
+        pre_extracted = extract_fields(scraped_data)
+    resolved = {
+        field: hit["value"] for field, hit in pre_extracted.items()
+        if field in VERITIC_FIELDS and hit["confidence"] >= config.EXTRACT_MIN_CONFIDENCE
+    }
+    unresolved = [field for field in VERITIC_FIELDS if field not in resolved]
 
     # --- Call B: VERITIC LOGIC (Facts & Audit) ---
-    veritic_prompt = f"""
+    veritic_prompt = None
+    if unresolved:
+        field_names = ", ".join(VERITIC_LABELS[f] for f in unresolved)
+        extracted_template = ",\n".join(f'            "{f}": "..."' for f in unresolved)
+        verified_facts = "\n".join(f"    - {VERITIC_LABELS[f]}: {v}" for f, v in resolved.items()) or "    - none"
+        veritic_prompt = f"""
     ROLE: Veritic Auditor. You verify facts logically.
     
     INPUT DATA:
     - Client Name: {client}
     - Industry: {industry}
     - Scraped Web Content: {web_content}
+
+    ALREADY VERIFIED ON THE WEB (do not extract again, count them as found):
+{verified_facts}
     
     TASK:
     Extract specific data points and verify integrity.
-    1. Extract the same fields (Director, Email, Deadline, Tuition, Open Day, Facilities) from the web content.
+    1. Extract these fields ({field_names}) from the web content.
     2. If not found, mark as "MISSING".
-    3. Integrity Score: Rate 0-100 based on completeness and transparency of contact info.
+    3. Integrity Score: Rate 0-100 based on completeness and transparency of contact info (including the already verified fields).
 
     OUTPUT JSON format:
     {{
         "integrity_score": int,
         "extracted_data": {{
-            "director": "...",
-            "email": "...",
-            "deadline": "...",
-            "tuition": "...",
-            "open_day": "...",
-            "facilities": "..."
+{extracted_template}
         }},
-        "missing_data": ["list", "of", "missing", "items"]
+        "missing_data": ["list", "of", "missing", "items"],
+        "confidence": int (0-100, how sure you are about this answer)
     }}
     """
 
@@ -106,60 +193,250 @@ async def analyze_universal(scraped_data: dict, client_brief: dict):
         "brand_score": int,
         "archetype": "...",
         "vibe": ["adj1", "adj2", "adj3"],
-        "alignment_analysis": "Short comment on goals vs reality."
+        "alignment_analysis": "Short comment on goals vs reality.",
+        "confidence": int (0-100, how sure you are about this answer)
     }}
     """
 
-    # Execute Parallel Calls
+    # Execute Parallel Calls (Veritic only when something is left unresolved)
+    # Each starts on its routed tier and escalates when the answer does not pass its check
+    calls = [generate("choice", _json_call(choice_prompt), check=_check_choice)]
+    if veritic_prompt:
+        calls.append(generate("veritic", _json_call(veritic_prompt), check=lambda raw: _check_veritic(raw, unresolved)))
+    # A failed part is replaced by a stub with "error" set, the rest of the audit is kept
+    choice_result, *veritic = await asyncio.gather(*calls, return_exceptions=True)
+    if not isinstance(choice_result, dict):
+        log.warning("Choice failed, continuing without it", extra={"client": client, "error": _failure(choice_result)})
+        choice_result = {"brand_score": None, "archetype": "Unknown", "vibe": [],
+                         "alignment_analysis": f"Error: {_failure(choice_result)}", "error": _failure(choice_result)}
+    if veritic and not isinstance(veritic[0], dict):
+        log.warning("Veritic failed, continuing without it", extra={"client": client, "error": _failure(veritic[0])})
+        veritic = [{"integrity_score": None, "extracted_data": {}, "missing_data": [], "error": _failure(veritic[0])}]
+
+    with span("analysis.parse"):
+        veritic_result = _merge_veritic(veritic[0] if veritic else None, resolved, pre_extracted)
+    return veritic_result, choice_result
+
+def _failure(outcome):
+    return str(outcome) if isinstance(outcome, BaseException) else "answer could not be parsed"
+
+# --- Answer checks for model tiering: (parsed, None) or (parsed, (reason, detail)) ---
+
+def _score(value):
+    """0-100 score from int, float or text like "85" / "85%"; None when there is none."""
     try:
-        response_rim, response_ver, response_cho = await asyncio.gather(
-            model.generate_content_async(
-                rimlab_prompt,
-                generation_config=GenerationConfig(response_mime_type="application/json")
-            ),
-            model.generate_content_async(
-                veritic_prompt,
-                generation_config=GenerationConfig(response_mime_type="application/json")
-            ),
-            model.generate_content_async(
-                choice_prompt,
-                generation_config=GenerationConfig(response_mime_type="application/json")
-            )
-        )
+        score = round(float(str(value).strip().rstrip("%")))
+    except (TypeError, ValueError, OverflowError):
+        return None
+    return score if 0 <= score <= 100 else None
+
+def _low_confidence(result):
+    confidence = result.get("confidence")
+    if confidence is None:
+        return None
+    # Unreadable confidence counts as low: worth a stronger tier, but never a failed audit
+    score = _score(confidence)
+    if score is None or score < config.MODEL_MIN_CONFIDENCE:
+        return ("low_confidence", f"confidence {confidence}")
+    return None
+
+def _check_rimlab(raw):
+    result = json.loads(raw)
+    if not isinstance(result, dict) or "ai_director" not in result:
+        raise ValueError("RimLab answer is not an object with ai_director")
+    # Low confidence is what RimLab measures, so it is never a reason to escalate
+    return result, None
+
+def _check_choice(raw):
+    result = json.loads(raw)
+    if not isinstance(result, dict):
+        raise ValueError("Choice answer is not an object")
+    result["brand_score"] = _score(result.get("brand_score"))
+    if not isinstance(result.get("archetype"), str):
+        result["archetype"] = "Unknown"
+    if not isinstance(result.get("vibe"), list):
+        result["vibe"] = []
+    if result["brand_score"] is None or result["archetype"] == "Unknown":
+        return result, ("low_confidence", "no brand_score/archetype")
+    return result, _low_confidence(result)
+
+def _check_veritic(raw, requested):
+    result = json.loads(raw)
+    if not isinstance(result, dict):
+        raise ValueError("Veritic answer is not an object")
+    extracted = result.get("extracted_data")
+    missing_list = result.get("missing_data")
+    if not isinstance(extracted, dict) or not isinstance(missing_list, list):
+        raise ValueError("Veritic answer is missing extracted_data/missing_data")
+    stated = result.get("integrity_score")
+    score = result["integrity_score"] = _score(stated)
+    if score is None:
+        return result, ("low_confidence", f"integrity_score {stated!r}")
+
+    listed = {str(m).lower().replace(" ", "_") for m in missing_list}
+    found = {f for f in requested if str(extracted.get(f) or "MISSING").strip().upper() not in ("MISSING", "", "N/A")}
+    contradicted = sorted(found & listed)
+    if contradicted:
+        return result, ("inconsistent", f"{contradicted} extracted but listed as missing")
+    # Score out of line with how much is actually missing (verified fields count as found)
+    missing_share = (len(requested) - len(found)) / len(VERITIC_FIELDS)
+    if score > 80 and missing_share >= 0.5:
+        return result, ("inconsistent", f"score {score} with {len(requested) - len(found)} fields missing")
+    if score < 50 and not listed and len(found) == len(requested):
+        return result, ("inconsistent", f"score {score} with nothing missing")
+    return result, _low_confidence(result)
 
-        rimlab_result = json.loads(response_rim.text)
-        veritic_result = json.loads(response_ver.text)
-        choice_result = json.loads(response_cho.text)
-
-        # Layman Verdict Synthesis
-        layman_verdict = ""
-        score = veritic_result.get('integrity_score', 0)
-
-        # Simple synthesis logic
-        ai_dir = rimlab_result.get('ai_director', 'Unknown')
-        web_dir = veritic_result.get('extracted_data', {}).get('director', 'MISSING')
-
-        if score < 50:
-            layman_verdict = f"CRITICAL: The website is missing key data (Score {score}). AI hallucinates Director as '{ai_dir}' while the site shows '{web_dir}'."
-        elif score > 80:
-            layman_verdict = f"EXCELLENT: High data integrity (Score {score}). Web data confirms facts, minimizing AI hallucination risk."
-        else:
-            layman_verdict = f"WARNING: Moderate integrity (Score {score}). Some data is missing, causing potential AI confusion (AI thinks Director is '{ai_dir}')."
-
-        return {
-            "rimlab_result": rimlab_result,
-            "veritic_result": veritic_result,
-            "choice_result": choice_result,
-            "layman_verdict": layman_verdict,
-            "metadata": {
-                "client": client,
-                "url": scraped_data.get('url', 'N/A')
-            }
+def _synthesize(client, scraped_data, rimlab_result, veritic_result, choice_result):
+    # Layman Verdict Synthesis
+    layman_verdict = ""
+    score = veritic_result.get('integrity_score', 0)
+
+    # Simple synthesis logic
+    ai_dir = rimlab_result.get('ai_director', 'Unknown')
+    web_dir = veritic_result.get('extracted_data', {}).get('director', 'MISSING')
+
+    if score is None:
+        layman_verdict = f"UNKNOWN: The integrity check did not produce a score, the other results are still valid (AI thinks Director is '{ai_dir}')."
+    elif score < 50:
+        layman_verdict = f"CRITICAL: The website is missing key data (Score {score}). AI hallucinates Director as '{ai_dir}' while the site shows '{web_dir}'."
+    elif score > 80:
+        layman_verdict = f"EXCELLENT: High data integrity (Score {score}). Web data confirms facts, minimizing AI hallucination risk."
+    else:
+        layman_verdict = f"WARNING: Moderate integrity (Score {score}). Some data is missing, causing potential AI confusion (AI thinks Director is '{ai_dir}')."
+
+    return {
+        "rimlab_result": rimlab_result,
+        "veritic_result": veritic_result,
+        "choice_result": choice_result,
+        "layman_verdict": layman_verdict,
+        "metadata": {
+            "client": client,
+            "url": scraped_data.get('url', 'N/A'),
+            # Parts that failed and hold placeholders (the audit itself still succeeded)
+            "failed": [name for name, part in (("rimlab", rimlab_result), ("veritic", veritic_result), ("choice", choice_result))
+                       if part.get("error")]
         }
+    }
 
-    except Exception as e:
-        print(f"Analysis Error: {e}")
-        return _error_response(str(e))
+def _rimlab_prompt(client):
+    return f"""
+    ROLE: Naive User.
+    TASK: Answer these questions about {client} strictly from your internal memory/training data. If unsure, guess.
+
+    QUESTIONS:
+{RIMLAB_QUESTIONS}
+
+    OUTPUT JSON format:
+    {{
+        "ai_director": "...",
+        "ai_email": "...",
+        "ai_deadline": "...",
+        "ai_tuition": "...",
+        "ai_open_house": "...",
+        "ai_pool": "...",
+        "confidence": "..."
+    }}
+    """
+
+def rimlab_batch_prompt(clients: dict):
+    """One prompt for many clients ({id: client_name}), answered per id."""
+    client_list = "\n".join(f'    - id "{cid}": {name}' for cid, name in clients.items())
+    return f"""
+    ROLE: Naive User.
+    TASK: For EACH client below, answer these questions strictly from your internal memory/training data. If unsure, guess.
+    Answer every client independently and copy its id exactly.
+
+    CLIENTS:
+{client_list}
+
+    QUESTIONS:
+{RIMLAB_QUESTIONS}
+
+    OUTPUT: a JSON array with exactly one object per client id, with the keys "id", {", ".join(f'"{k}"' for k in RIMLAB_KEYS)}.
+    """
+
+def split_rimlab_batch(raw_text, clients: dict):
+    """Maps a batched answer back to {client_name: rimlab_result}; unanswered ids are left out."""
+    answers = json.loads(raw_text)
+    results = {}
+    for answer in answers if isinstance(answers, list) else []:
+        cid = str(answer.get("id", "")) if isinstance(answer, dict) else ""
+        if cid in clients:
+            results[clients[cid]] = {k: answer.get(k, "Unknown") for k in RIMLAB_KEYS}
+    return results
+
+async def probe_rimlab_batch(client_names: list, batch_size: int = None):
+    """
+    RimLab for many clients at once: packs batch_size clients into one
+    schema-constrained request and splits the answers back per client.
+    Clients the model skipped are retried with the single-client prompt;
+    clients that still fail are left out of the result. At most
+    RIMLAB_BATCH_CONCURRENCY model calls (batched or single) run at once.
+    """
+    batch_size = batch_size or config.RIMLAB_BATCH_SIZE
+    names = list(dict.fromkeys(client_names))
+    chunks = [names[i:i + batch_size] for i in range(0, len(names), batch_size)]
+    semaphore = asyncio.Semaphore(config.RIMLAB_BATCH_CONCURRENCY)
+
+    async def run_chunk(chunk):
+        clients = {f"c{i}": name for i, name in enumerate(chunk)}
+
+        def check(raw):
+            answered = split_rimlab_batch(raw, clients)
+            return answered, None if answered else ("schema", "no client id answered")
+
+        try:
+            async with semaphore:
+                return await generate(
+                    "rimlab_batch",
+                    _json_call(rimlab_batch_prompt(clients), response_schema=RIMLAB_BATCH_SCHEMA),
+                    check=check
+                )
+        except Exception as e:
+            log.warning("RimLab batch error", extra={"clients": len(chunk), "error": str(e)})
+            return {}
+
+    results = {}
+    for chunk_result in await asyncio.gather(*[run_chunk(c) for c in chunks]):
+        results.update(chunk_result or {})
+
+    async def run_single(name):
+        try:
+            async with semaphore:
+                return name, await probe_rimlab(name)
+        except Exception as e:
+            # Left out, so the audit runs its own RimLab instead of showing an error stub
+            log.warning("RimLab error", extra={"client": name, "error": str(e)})
+            return name, None
+
+    missing = [name for name in names if name not in results]
+    if missing:
+        log.info("RimLab batch: clients unanswered, retrying one by one", extra={"clients": len(missing)})
+        for name, result in await asyncio.gather(*[run_single(n) for n in missing]):
+            if result is not None:
+                results[name] = result
+    return results
+
+def _merge_veritic(llm_result, resolved, pre_extracted):
+    """Combines rule-based hits with the LLM answer for the unresolved fields."""
+    if llm_result is None:
+        # Everything was found deterministically: score from extraction confidence
+        confidences = [pre_extracted[f]["confidence"] for f in resolved]
+        llm_result = {
+            "integrity_score": round(100 * sum(confidences) / len(confidences)),
+            "extracted_data": {},
+            "missing_data": []
+        }
+
+    extracted = {f: v for f, v in (llm_result.get('extracted_data') or {}).items() if f not in resolved}
+    extracted.update(resolved)
+    llm_result['extracted_data'] = {f: extracted[f] for f in VERITIC_FIELDS if f in extracted}
+    llm_result['missing_data'] = [
+        m for m in (llm_result.get('missing_data') or [])
+        if str(m).lower().replace(" ", "_") not in resolved
+    ]
+    llm_result['pre_extracted'] = pre_extracted
+    return llm_result
 
 def _error_response(msg):
     return {
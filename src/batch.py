@@ -0,0 +1,221 @@
+import argparse
+import asyncio
+import json
+import os
+import re
+import time
+
+from vertexai.generative_models import GenerativeModel, GenerationConfig
+
+from src import config
+from src.models import model_for
+from src.analyzer import rimlab_batch_prompt, split_rimlab_batch, RIMLAB_BATCH_SCHEMA, RIMLAB_KEYS
+
+# Offline RimLab for overnight campaigns:
+#   clients JSONL in -> prediction requests JSONL -> batch backend -> predictions JSONL -> results JSONL out
+# Request/prediction lines use the Vertex AI batch prediction format, so the local
+# backend is a drop-in, file-based stand-in for the real batch job.
+
+# Same starting tier as online RimLab (no escalation in a batch job)
+MODEL = model_for("rimlab_batch")
+
+
+def _rest_schema(schema):
+    """SDK-style schema -> REST schema (enum type names are upper case there)."""
+    if isinstance(schema, dict):
+        return {k: (v.upper() if k == "type" else _rest_schema(v)) for k, v in schema.items()}
+    if isinstance(schema, list):
+        return [_rest_schema(v) for v in schema]
+    return schema
+
+
+def _response_text(prediction):
+    try:
+        return prediction["response"]["candidates"][0]["content"]["parts"][0]["text"]
+    except (KeyError, IndexError, TypeError):
+        return None
+
+
+def read_clients(path):
+    """Client names from JSONL ({"client_name": ...} objects or plain strings)."""
+    names = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            name = item if isinstance(item, str) else item.get("client_name") or item.get("name")
+            if name:
+                names.append(name)
+    return list(dict.fromkeys(names))
+
+
+def build_requests(client_names, batch_size=None):
+    """Packs clients into batched prompts. Ids are unique across the whole job."""
+    batch_size = batch_size or config.RIMLAB_BATCH_SIZE
+    ids = {f"c{i}": name for i, name in enumerate(client_names)}
+    id_list = list(ids)
+    requests = []
+    for start in range(0, len(id_list), batch_size):
+        chunk = {cid: ids[cid] for cid in id_list[start:start + batch_size]}
+        requests.append({
+            "request": {
+                "contents": [{"role": "user", "parts": [{"text": rimlab_batch_prompt(chunk)}]}],
+                "generationConfig": {
+                    "responseMimeType": "application/json",
+                    "responseSchema": _rest_schema(RIMLAB_BATCH_SCHEMA)
+                }
+            }
+        })
+    return ids, requests
+
+
+def _write_jsonl(path, rows):
+    with open(path, "w", encoding="utf-8") as f:
+        for row in rows:
+            f.write(json.dumps(row, ensure_ascii=False) + "\n")
+
+
+def _read_jsonl(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+# --- Backends ---
+
+async def model_responder(prompt):
+    model = GenerativeModel(MODEL)
+    response = await model.generate_content_async(
+        prompt,
+        generation_config=GenerationConfig(
+            response_mime_type="application/json",
+            response_schema=RIMLAB_BATCH_SCHEMA
+        )
+    )
+    return response.text
+
+
+async def placeholder_responder(prompt):
+    """No network: answers "Unknown" for every client id in the prompt (pipeline testing)."""
+    ids = re.findall(r'id "(c\d+)"', prompt)
+    return json.dumps([{"id": cid, **{k: "Unknown" for k in RIMLAB_KEYS}} for cid in ids])
+
+
+class LocalBatchBackend:
+    """File-based stand-in for a Vertex batch job: same input/output JSONL formats."""
+
+    def __init__(self, respond=model_responder, concurrency=4):
+        self.respond = respond
+        self.concurrency = concurrency
+
+    async def run(self, input_path, output_path):
+        rows = _read_jsonl(input_path)
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def predict(row):
+            async with semaphore:
+                prompt = row["request"]["contents"][0]["parts"][0]["text"]
+                try:
+                    text = await self.respond(prompt)
+                    return {**row, "response": {"candidates": [{"content": {"role": "model", "parts": [{"text": text}]}}]}, "status": ""}
+                except Exception as e:
+                    return {**row, "response": None, "status": str(e)}
+
+        _write_jsonl(output_path, await asyncio.gather(*[predict(r) for r in rows]))
+        return output_path
+
+
+class VertexBatchBackend:
+    """Runs the requests as a Vertex AI batch prediction job staged through GCS."""
+
+    def __init__(self, bucket, prefix="rimlab-batch", poll_interval=60):
+        self.bucket = bucket
+        self.prefix = prefix
+        self.poll_interval = poll_interval
+
+    def _run(self, input_path, output_path):
+        from google.cloud import storage
+        from vertexai.batch_prediction import BatchPredictionJob
+
+        job_dir = f"{self.prefix}/{time.strftime('%Y%m%d-%H%M%S')}"
+        bucket = storage.Client().bucket(self.bucket)
+        bucket.blob(f"{job_dir}/requests.jsonl").upload_from_filename(input_path)
+
+        job = BatchPredictionJob.submit(
+            source_model=MODEL,
+            input_dataset=f"gs://{self.bucket}/{job_dir}/requests.jsonl",
+            output_uri_prefix=f"gs://{self.bucket}/{job_dir}/output"
+        )
+        print(f"Batch job submitted: {job.resource_name}")
+        while not job.has_ended:
+            time.sleep(self.poll_interval)
+            job.refresh()
+        if not job.has_succeeded:
+            raise RuntimeError(f"Batch job failed: {job.error}")
+
+        # Output location is gs://bucket/path/... with one or more predictions*.jsonl files
+        output_prefix = job.output_location.split(f"gs://{self.bucket}/", 1)[1]
+        with open(output_path, "wb") as out:
+            for blob in bucket.list_blobs(prefix=output_prefix):
+                if blob.name.endswith(".jsonl"):
+                    out.write(blob.download_as_bytes())
+        return output_path
+
+    async def run(self, input_path, output_path):
+        return await asyncio.to_thread(self._run, input_path, output_path)
+
+
+# --- Pipeline ---
+
+async def run_batch(input_path, output_path, backend, batch_size=None):
+    client_names = read_clients(input_path)
+    ids, requests = build_requests(client_names, batch_size)
+    print(f"RimLab batch: {len(client_names)} clients in {len(requests)} requests")
+
+    work_prefix = os.path.splitext(output_path)[0]
+    requests_path = f"{work_prefix}.requests.jsonl"
+    predictions_path = f"{work_prefix}.predictions.jsonl"
+    _write_jsonl(requests_path, requests)
+    await backend.run(requests_path, predictions_path)
+
+    results = {}
+    for prediction in _read_jsonl(predictions_path):
+        text = _response_text(prediction)
+        if text is None:
+            print(f"Batch request failed: {prediction.get('status')}")
+            continue
+        try:
+            results.update(split_rimlab_batch(text, ids))
+        except json.JSONDecodeError as e:
+            print(f"Batch response is not valid JSON: {e}")
+
+    _write_jsonl(output_path, [
+        {"client_name": name, "rimlab_result": results.get(name), "error": None if name in results else "No answer"}
+        for name in client_names
+    ])
+    print(f"RimLab batch: {len(results)}/{len(client_names)} answered -> {output_path}")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline batched RimLab probing (JSONL in, JSONL out).")
+    parser.add_argument("input", help="JSONL with one client per line ({\"client_name\": ...})")
+    parser.add_argument("output", help="JSONL with one rimlab_result per client")
+    parser.add_argument("--backend", choices=["local", "vertex"], default="local")
+    parser.add_argument("--bucket", default=config.BATCH_GCS_BUCKET, help="GCS bucket for the vertex backend")
+    parser.add_argument("--batch-size", type=int, default=config.RIMLAB_BATCH_SIZE)
+    parser.add_argument("--dry-run", action="store_true", help="local backend with placeholder answers, no model calls")
+    args = parser.parse_args()
+
+    if args.backend == "vertex":
+        if not args.bucket:
+            parser.error("--bucket (or BATCH_GCS_BUCKET) is required for the vertex backend")
+        backend = VertexBatchBackend(args.bucket)
+    else:
+        backend = LocalBatchBackend(placeholder_responder if args.dry_run else model_responder)
+
+    asyncio.run(run_batch(args.input, args.output, backend, args.batch_size))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+from playwright.async_api import async_playwright
+
+from src.scraper import scrape_site
+from src.analyzer import run_audit, probe_rimlab_batch
+from src.leads import read_leads_file
+from src.snapshots import get_snapshot_store, archive_snapshot
+from src.results import audit_row, get_results_store
+from src.telemetry import new_trace, setup_logging, span
+
+# Headless bulk runner:
+#   python -m src.cli leads.xlsx --output audits.jsonl --concurrency 4
+# Every finished lead is appended to the output JSONL right away, so the file itself
+# is the checkpoint: re-running the same command skips leads that already succeeded.
+# With a results store, a lead is only checkpointed once its row is on disk as well.
+
+
+def lead_id(lead):
+    return f"{lead['client_name']}|{lead['url']}"
+
+
+def load_finished(output_path):
+    """Ids of leads with a successful record in an existing output file."""
+    finished = set()
+    if not os.path.exists(output_path):
+        return finished
+    with open(output_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # Torn last line after a crash
+                continue
+            if not record.get("error"):
+                finished.add(record["id"])
+    return finished
+
+
+class Progress:
+    """Live throughput / ETA line, plus a small checkpoint file next to the output."""
+
+    def __init__(self, total, skipped, checkpoint_path):
+        self.total = total
+        self.skipped = skipped
+        self.done = 0
+        self.failed = 0
+        self.started = time.monotonic()
+        self.checkpoint_path = checkpoint_path
+
+    def update(self, failed):
+        self.done += 1
+        self.failed += int(failed)
+
+        elapsed = time.monotonic() - self.started
+        rate = self.done / elapsed if elapsed else 0.0
+        remaining = self.total - self.skipped - self.done
+        eta = remaining / rate if rate else 0
+        line = (f"[{self.skipped + self.done}/{self.total}] {rate * 60:.1f} leads/min, "
+                f"ETA {int(eta // 60)}m{int(eta % 60):02d}s, failed {self.failed}")
+        end = "\r" if sys.stdout.isatty() and remaining else "\n"
+        print(line.ljust(70), end=end, flush=True)
+
+        tmp_path = self.checkpoint_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({
+                "total": self.total,
+                "finished": self.skipped + self.done - self.failed,
+                "failed": self.failed,
+                "leads_per_min": round(rate * 60, 2),
+                "updated_at": time.strftime("%Y-%m-%dT%H:%M:%S")
+            }, f)
+        os.replace(tmp_path, self.checkpoint_path)
+
+
+async def audit_lead(lead, browser, rimlab_result=None, snapshot_store=None):
+    # Each lead runs in its own gather() task, so this trace stays local to it
+    new_trace(request_id=lead_id(lead))
+    with span("cli.audit", url=lead["url"]):
+        return await _audit_lead(lead, browser, rimlab_result, snapshot_store)
+
+
+async def _audit_lead(lead, browser, rimlab_result, snapshot_store):
+    async def scrape():
+        scraped_data = await scrape_site(lead["url"], browser)
+        if not scraped_data:
+            return {"content_preview": "", "title": "Scraping Failed", "url": lead["url"]}
+        if snapshot_store:
+            await archive_snapshot(snapshot_store, scraped_data, lead)
+        return scraped_data
+
+    return await run_audit(lead, scrape, rimlab_result=rimlab_result)
+
+
+async def run(input_path, output_path, concurrency, batch_rimlab, campaign=None):
+    leads = read_leads_file(input_path, input_path)
+    finished = load_finished(output_path)
+    todo = [lead for lead in leads if lead_id(lead) not in finished]
+    print(f"{len(leads)} leads, {len(leads) - len(todo)} already done, {len(todo)} to audit")
+    if not todo:
+        return
+
+    rimlab = {}
+    if batch_rimlab:
+        rimlab = await probe_rimlab_batch([lead["client_name"] for lead in todo])
+
+    snapshot_store = get_snapshot_store()
+    results_store = get_results_store()
+    campaign = campaign or os.path.splitext(os.path.basename(input_path))[0]
+    progress = Progress(len(leads), len(leads) - len(todo), output_path + ".checkpoint.json")
+    semaphore = asyncio.Semaphore(concurrency)
+    write_lock = asyncio.Lock()
+    # Records whose results-store row is still buffered (checkpointed after the flush)
+    pending = []
+
+    with open(output_path, "a", encoding="utf-8") as out:
+        async with async_playwright() as p:
+            browser = await p.chromium.launch(headless=True)
+
+            async def worker(lead):
+                async with semaphore:
+                    error = None
+                    try:
+                        result = await audit_lead(lead, browser, rimlab.get(lead["client_name"]), snapshot_store)
+                        if result.get("metadata", {}).get("error"):
+                            error = result["choice_result"].get("alignment_analysis", "Analysis failed")
+                    except Exception as e:
+                        result, error = None, str(e)
+
+                    record = {"id": lead_id(lead), "lead": lead, "result": result, "error": error,
+                              "finished_at": time.strftime("%Y-%m-%dT%H:%M:%S")}
+                    if results_store and result is not None:
+                        try:
+                            results_store.append(audit_row(result, lead, campaign, source="cli"))
+                        except Exception as e:
+                            record["error"] = record["error"] or f"Results store: {e}"
+                            await checkpoint([record])
+                            return
+                        pending.append(record)
+                        if results_store.flush_due():
+                            await flush_pending()
+                    else:
+                        await checkpoint([record])
+
+            async def checkpoint(records):
+                async with write_lock:
+                    for record in records:
+                        out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                    out.flush()
+                    os.fsync(out.fileno())
+                    for record in records:
+                        progress.update(failed=bool(record["error"]))
+
+            async def flush_pending(final=False):
+                # Taken before the flush starts, so every record here has its row in that flush
+                records = pending[:]
+                pending.clear()
+                try:
+                    await asyncio.to_thread(results_store.flush)
+                except Exception as e:
+                    if not final:
+                        # Rows stay buffered in the store, their records wait for the next flush
+                        pending[:0] = records
+                        return
+                    # Not persisted: recorded as failed, so the next run audits them again
+                    for record in records:
+                        record["error"] = record["error"] or f"Results store: {e}"
+                await checkpoint(records)
+
+            try:
+                await asyncio.gather(*[worker(lead) for lead in todo])
+            finally:
+                await browser.close()
+                if results_store:
+                    await flush_pending(final=True)
+
+    print(f"Done: {progress.done - progress.failed} ok, {progress.failed} failed -> {output_path}")
+    if progress.failed:
+        print("Re-run the same command to retry failed leads.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk audits without the HTTP layer (resumable JSONL output).")
+    parser.add_argument("input", help="Lead list (.csv / .xls / .xlsx), same columns as /upload-leads")
+    parser.add_argument("--output", "-o", default="audits.jsonl", help="JSONL results file, appended to and used for resume")
+    parser.add_argument("--concurrency", "-c", type=int, default=4, help="Leads audited at the same time")
+    parser.add_argument("--batch-rimlab", action="store_true", help="Run RimLab for all leads up front in batched calls")
+    parser.add_argument("--campaign", help="Campaign id for the results store (default: input file name)")
+    args = parser.parse_args()
+    setup_logging()
+
+    try:
+        asyncio.run(run(args.input, args.output, args.concurrency, args.batch_rimlab, args.campaign))
+    except KeyboardInterrupt:
+        print(f"\nInterrupted, finished leads are saved in {args.output}; re-run to resume.")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,2 +1,87 @@
 # config.py
 # Configuration settings
+import os
+
+# Vertex AI
+VERTEX_LOCATION = os.environ.get("VERTEX_LOCATION", "us-central1")
+
+# Lead generator (fan-out mode)
+LEADS_FANOUT_CONCURRENCY = int(os.environ.get("LEADS_FANOUT_CONCURRENCY", "4"))
+LEADS_MAX_SUBQUERIES = int(os.environ.get("LEADS_MAX_SUBQUERIES", "12"))
+
+# Scraper (caps enforced inside the browser before serialization)
+SCRAPE_MAX_TEXT_CHARS = int(os.environ.get("SCRAPE_MAX_TEXT_CHARS", "5000"))
+SCRAPE_MAX_ITEMS = int(os.environ.get("SCRAPE_MAX_ITEMS", "20"))
+SCRAPE_MAX_BLOCK_CHARS = int(os.environ.get("SCRAPE_MAX_BLOCK_CHARS", "20000"))
+
+# Rule-based pre-extraction: fields at or above this confidence skip the Veritic LLM call
+EXTRACT_MIN_CONFIDENCE = float(os.environ.get("EXTRACT_MIN_CONFIDENCE", "0.8"))
+
+# Scrape worker pool (separate processes, each with its own browser)
+# Per CPU of the container quota (cgroup cpu.max); 0 = scrape inside the API process
+SCRAPE_WORKERS_PER_CORE = float(os.environ.get("SCRAPE_WORKERS_PER_CORE", "1"))
+SCRAPE_MAX_PENDING = int(os.environ.get("SCRAPE_MAX_PENDING", "32"))
+SCRAPE_JOBS_PER_WORKER = int(os.environ.get("SCRAPE_JOBS_PER_WORKER", "50"))
+# Whole scrape (navigation + extraction) per job; a worker stuck longer is killed
+SCRAPE_JOB_TIMEOUT = float(os.environ.get("SCRAPE_JOB_TIMEOUT", "60"))
+
+# Admission control for /audit (0 disables the memory/CPU checks)
+ADMISSION_MAX_IN_FLIGHT = int(os.environ.get("ADMISSION_MAX_IN_FLIGHT", "4"))
+ADMISSION_MAX_QUEUE = int(os.environ.get("ADMISSION_MAX_QUEUE", "16"))
+ADMISSION_QUEUE_TIMEOUT = float(os.environ.get("ADMISSION_QUEUE_TIMEOUT", "30"))
+ADMISSION_MAX_MEMORY_PERCENT = float(os.environ.get("ADMISSION_MAX_MEMORY_PERCENT", "85"))
+# Share of the container's CPU quota in use (cgroup), 1.0 = fully busy
+ADMISSION_MAX_LOAD_PER_CORE = float(os.environ.get("ADMISSION_MAX_LOAD_PER_CORE", "0.95"))
+
+# RimLab batched probing (clients per request)
+RIMLAB_BATCH_SIZE = int(os.environ.get("RIMLAB_BATCH_SIZE", "25"))
+# Model calls in flight per /rimlab-batch request (batched chunks and single-client retries)
+RIMLAB_BATCH_CONCURRENCY = int(os.environ.get("RIMLAB_BATCH_CONCURRENCY", "4"))
+
+# Offline batch prediction (vertex backend stages files in this bucket)
+BATCH_GCS_BUCKET = os.environ.get("BATCH_GCS_BUCKET")
+
+# Priority scheduler (slots = ADMISSION_MAX_IN_FLIGHT)
+SCHEDULER_RESERVED_INTERACTIVE = int(os.environ.get("SCHEDULER_RESERVED_INTERACTIVE", "1"))
+SCHEDULER_RESERVED_CAMPAIGN = int(os.environ.get("SCHEDULER_RESERVED_CAMPAIGN", "0"))
+# Seconds of waiting worth one priority class; 0 = ADMISSION_QUEUE_TIMEOUT / 3 (also the upper bound)
+SCHEDULER_AGING_SECONDS = float(os.environ.get("SCHEDULER_AGING_SECONDS", "0"))
+
+# Raw page snapshot archive: "" (off), "local" or "gcs"
+SNAPSHOT_BACKEND = os.environ.get("SNAPSHOT_BACKEND", "")
+SNAPSHOT_LOCAL_DIR = os.environ.get("SNAPSHOT_LOCAL_DIR", "snapshots")
+SNAPSHOT_GCS_BUCKET = os.environ.get("SNAPSHOT_GCS_BUCKET")
+SNAPSHOT_GCS_PREFIX = os.environ.get("SNAPSHOT_GCS_PREFIX", "snapshots")
+SNAPSHOT_MAX_HTML_CHARS = int(os.environ.get("SNAPSHOT_MAX_HTML_CHARS", "2000000"))
+
+# Structured logging / tracing (sample rates apply to INFO-and-below logs and exported spans)
+GOOGLE_CLOUD_PROJECT = os.environ.get("GOOGLE_CLOUD_PROJECT")
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+LOG_SAMPLE_RATE = float(os.environ.get("LOG_SAMPLE_RATE", "1.0"))
+TRACE_SAMPLE_RATE = float(os.environ.get("TRACE_SAMPLE_RATE", "1.0"))
+# Span export: JSONL file and/or OTLP/HTTP JSON collector, e.g. http://localhost:4318/v1/traces
+TRACE_EXPORT_FILE = os.environ.get("TRACE_EXPORT_FILE", "")
+TRACE_OTLP_ENDPOINT = os.environ.get("TRACE_OTLP_ENDPOINT", "")
+TRACE_SERVICE_NAME = os.environ.get("TRACE_SERVICE_NAME", "choice-ai-pilot")
+
+# Model tiering: each task starts on its tier ("fast" unless MODEL_ROUTES says otherwise)
+# and escalates to the strong model when the answer fails validation.
+# MODEL_ROUTES example: "choice=strong,support_chat=fast"
+MODEL_FAST = os.environ.get("MODEL_FAST", "gemini-2.5-flash")
+MODEL_STRONG = os.environ.get("MODEL_STRONG", "gemini-2.5-pro")
+MODEL_ROUTES = dict(
+    item.strip().split("=", 1) for item in os.environ.get("MODEL_ROUTES", "").split(",") if "=" in item
+)
+MODEL_ESCALATION = os.environ.get("MODEL_ESCALATION", "1") != "0"
+# Self-reported confidence (0-100) below this escalates Veritic / Choice answers
+MODEL_MIN_CONFIDENCE = int(os.environ.get("MODEL_MIN_CONFIDENCE", "60"))
+
+# Audit results store (Parquet under RESULTS_DIR, "" disables it). Off by default: Cloud Run's
+# local disk is gone with the instance, point it at a mounted volume (e.g. a Cloud Storage mount)
+RESULTS_DIR = os.environ.get("RESULTS_DIR", "")
+RESULTS_FLUSH_ROWS = int(os.environ.get("RESULTS_FLUSH_ROWS", "100"))
+RESULTS_FLUSH_SECONDS = float(os.environ.get("RESULTS_FLUSH_SECONDS", "30"))
+# Past days with at least this many part files are merged by `python -m src.results compact`
+RESULTS_COMPACT_FILES = int(os.environ.get("RESULTS_COMPACT_FILES", "20"))
+# Queries re-list the store at most this often to pick up other instances' parts
+RESULTS_REFRESH_SECONDS = float(os.environ.get("RESULTS_REFRESH_SECONDS", "30"))
@@ -0,0 +1,304 @@
+import re
+import unicodedata
+from datetime import date
+
+# Rule-based pre-extraction of Veritic fields. Runs on scrape_site() output before any
+# model call; every hit carries a confidence so the analyzer can decide what to trust.
+
+VERITIC_FIELDS = ["director", "email", "deadline", "tuition", "open_day", "facilities"]
+
+# Months (cs / sk / en), matched on accent-stripped lowercase text
+MONTHS = {
+    "ledna": 1, "leden": 1, "januara": 1, "januar": 1, "january": 1, "jan": 1,
+    "unora": 2, "unor": 2, "februara": 2, "februar": 2, "february": 2, "feb": 2,
+    "brezna": 3, "brezen": 3, "marca": 3, "marec": 3, "march": 3, "mar": 3,
+    "dubna": 4, "duben": 4, "aprila": 4, "april": 4, "apr": 4,
+    "kvetna": 5, "kveten": 5, "maja": 5, "maj": 5, "may": 5,
+    "cervna": 6, "cerven": 6, "juna": 6, "jun": 6, "june": 6,
+    "cervence": 7, "cervenec": 7, "jula": 7, "jul": 7, "july": 7,
+    "srpna": 8, "srpen": 8, "augusta": 8, "august": 8, "aug": 8,
+    "zari": 9, "septembra": 9, "september": 9, "sep": 9, "sept": 9,
+    "rijna": 10, "rijen": 10, "oktobra": 10, "oktober": 10, "october": 10, "oct": 10,
+    "listopadu": 11, "listopad": 11, "novembra": 11, "november": 11, "nov": 11,
+    "prosince": 12, "prosinec": 12, "decembra": 12, "december": 12, "dec": 12,
+}
+
+EMAIL_RE = re.compile(r"[a-z0-9._%+-]+@[a-z0-9.-]+\.[a-z]{2,}", re.I)
+PHONE_RE = re.compile(r"(?:\+|00)?\d{3}[\s.-]?\d{3}[\s.-]?\d{3}(?:[\s.-]?\d{3})?")
+NUMERIC_DATE_RE = re.compile(r"\b(\d{1,2})\.\s?(\d{1,2})\.\s?(\d{4})\b")
+ISO_DATE_RE = re.compile(r"\b(\d{4})-(\d{2})-(\d{2})(?!\d)")
+TEXT_DATE_RE = re.compile(r"\b(\d{1,2})\.?\s+([a-z]{3,10})\.?,?\s+(\d{4})\b")
+EN_DATE_RE = re.compile(r"\b([a-z]{3,9})\.?\s+(\d{1,2})(?:st|nd|rd|th)?,?\s+(\d{4})\b")
+# Thousands groups of exactly three digits ("45 000", "12.000,50"), so "rok 2026 45 000 Kč" is not one number
+AMOUNT_NUMBER = r"(?<![\d.,])(?:\d{1,3}(?:[ \xa0.,]\d{3})+(?:,\d{1,2})?|\d+(?:[.,]\d{1,2})?)(?!\d)"
+AMOUNT_RE = re.compile(
+    rf"(?:(?P<pre>€|eur|czk|kc)\s?(?P<num1>{AMOUNT_NUMBER}))"
+    rf"|(?:(?P<num2>{AMOUNT_NUMBER})\s?(?P<post>kc|czk|eur|€|,-))",
+    re.I,
+)
+# RimLab asks for the annual fee; a monthly amount is no answer to that
+MONTHLY_RE = re.compile(r"\b(mesicne|mesacne|za mesic|za mesiac|monthly|per month|a month)\b|/\s?(mesic|mesiac|month)\b")
+
+TITLE_RE = r"(?i:(?:prof|doc|mgr|ing|bc|phdr|paeddr|rndr|judr|mudr|phd|csc|dr|mba)\.?,?\s+)*"
+NAME_RE = r"([A-ZÁČĎÉĚÍĽĹŇÓÔŘŠŤÚŮÝŽ][a-záäčďéěíľĺňóôŕřšťúůýž]+\s+[A-ZÁČĎÉĚÍĽĹŇÓÔŘŠŤÚŮÝŽ][a-záäčďéěíľĺňóôŕřšťúůýž]+)"
+# Keyword and titles are case-insensitive, the name itself must be capitalized
+DIRECTOR_RE = re.compile(
+    r"(?i:ředitel(?:ka)?|riaditeľ(?:ka)?|director|principal|head\s*teacher|headmaster|headmistress)"
+    r"(?i:\s+(?:školy|gymnázia|of\s+the\s+school))?\s*[:\-–,]?\s*" + TITLE_RE + NAME_RE
+)
+
+OPEN_DAY_KEYWORDS = ["den otevrenych dveri", "dny otevrenych dveri", "dni otevrenych dveri", "den otvorenych dveri",
+                     "dod", "open day", "open house"]
+DEADLINE_KEYWORDS = ["prihlas", "uzaverk", "uzavierk", "termin podani", "podani prihlas", "deadline", "application"]
+TUITION_KEYWORDS = ["skolne", "tuition", "annual fee", "school fee", "poplatek za studium"]
+# Only words that mean a pool itself: "plavecký výcvik" or "city pool" are not the school's
+POOL_KEYWORDS = ["bazen", "plavaren", "swimming pool"]
+# "nemáme bazén", "bazén není", "no swimming pool" ... checked within the same clause
+NEGATION_BEFORE_RE = re.compile(r"\b(nem(a|ame|aji|aju)|nie\s+je|nen[ai]|bez|no|not|without)\b(?!.*\b(ale|but)\b)")
+NEGATION_AFTER_RE = re.compile(r"^\s*(\w+\s+){0,2}?(nem(a|ame|aji|aju)|neni|nie\s+je|not)\b")
+
+# Sentence end, but not the dots of "12. 1. 2026"
+SENTENCE_END_RE = re.compile(r"(?<!\b\d)(?<!\b\d\d)[.!?]\s")
+
+DATED_KEYWORDS = {"deadline": DEADLINE_KEYWORDS, "open_day": OPEN_DAY_KEYWORDS}
+
+# Characters of context searched around a keyword
+WINDOW = 160
+
+
+def _fold(text):
+    """Lowercase + strip accents, keeps string length stable for index mapping."""
+    return "".join(
+        unicodedata.normalize("NFD", ch)[0] for ch in (text or "").lower()
+    )
+
+
+def _hit(value, confidence, source):
+    return {"value": value, "confidence": confidence, "source": source}
+
+
+def _iter_json_ld(blocks):
+    stack = list(blocks or [])
+    while stack:
+        node = stack.pop()
+        if isinstance(node, list):
+            stack.extend(node)
+        elif isinstance(node, dict):
+            yield node
+            stack.extend(v for v in node.values() if isinstance(v, (dict, list)))
+
+
+def _ld_types(node):
+    types = node.get("@type", [])
+    return [t.lower() for t in (types if isinstance(types, list) else [types]) if isinstance(t, str)]
+
+
+def _find_dates(text):
+    """[(start, end, iso_date)] for every valid date in text, ordered by position."""
+    folded = _fold(text)
+    found = []
+    for m in NUMERIC_DATE_RE.finditer(folded):
+        found.append((m.start(), m.end(), int(m.group(3)), int(m.group(2)), int(m.group(1))))
+    for m in ISO_DATE_RE.finditer(folded):
+        found.append((m.start(), m.end(), int(m.group(1)), int(m.group(2)), int(m.group(3))))
+    for m in TEXT_DATE_RE.finditer(folded):
+        if m.group(2) in MONTHS:
+            found.append((m.start(), m.end(), int(m.group(3)), MONTHS[m.group(2)], int(m.group(1))))
+    for m in EN_DATE_RE.finditer(folded):
+        if m.group(1) in MONTHS:
+            found.append((m.start(), m.end(), int(m.group(3)), MONTHS[m.group(1)], int(m.group(2))))
+
+    dates = []
+    for start, end, y, mo, d in sorted(found):
+        try:
+            dates.append((start, end, date(y, mo, d).isoformat()))
+        except ValueError:
+            continue
+    return dates
+
+
+def parse_dates(text):
+    """All dates found in text, in order of appearance, as ISO strings."""
+    return list(dict.fromkeys(iso for _, _, iso in _find_dates(text)))
+
+
+def parse_amount(text):
+    """First currency amount in text, normalized to '<number> <CURRENCY>'."""
+    m = AMOUNT_RE.search(_fold(text))
+    if not m:
+        return None
+    number = m.group("num1") or m.group("num2") or ""
+    # "12.000" / "12 000" thousands separators vs. "12,50" decimals
+    integer, decimals = re.fullmatch(r"(.*?)((?:[.,]\d{1,2})?)", number).groups()
+    number = re.sub(r"[ \xa0.,]", "", integer) + decimals
+    unit = (m.group("pre") or m.group("post") or "").lower()
+    currency = "EUR" if unit in ("€", "eur") else "CZK"
+    return f"{number} {currency}"
+
+
+def _keyword_spans(text, keywords):
+    """(start, end) of each keyword occurrence, accent-insensitive."""
+    folded = _fold(text)
+    for keyword in keywords:
+        # Short keywords ("dod") must be whole words, not "dodatek"
+        pattern = r"\b" + re.escape(keyword) + (r"\b" if len(keyword) < 4 else "")
+        for m in re.finditer(pattern, folded):
+            yield m.start(), m.end()
+
+
+def _windows(text, keywords):
+    """Yields the text following each keyword occurrence."""
+    for start, end in _keyword_spans(text, keywords):
+        yield text[start:end + WINDOW]
+
+
+def _date_candidates(text):
+    """
+    {field: [(iso_date, distance)]} for the dated fields. Every date goes to one field
+    only, so in "Den otevřených dveří 12. 1. 2026 Přihlášky do 1. 3. 2026" the deadline
+    can only get 1. 3. A keyword before the date in the same sentence ("Open Day: 12. 1.")
+    always wins; otherwise the nearest one, where looking back ("12. 1. 2026 - Open Day")
+    counts double and never crosses a sentence end.
+    """
+    spans = [(field, start, end) for field, keywords in DATED_KEYWORDS.items() for start, end in _keyword_spans(text, keywords)]
+    candidates = {field: [] for field in DATED_KEYWORDS}
+    for d_start, d_end, iso in _find_dates(text):
+        best = None
+        for field, k_start, k_end in spans:
+            if d_start >= k_end:
+                distance = d_start - k_end
+                crosses = bool(SENTENCE_END_RE.search(text[k_end:d_start]))
+                if crosses:
+                    distance += WINDOW // 3
+                if distance > WINDOW:
+                    continue
+                rank = (crosses, distance)
+            elif d_end <= k_start:
+                distance = 2 * (k_start - d_end)
+                if distance > WINDOW // 2 or SENTENCE_END_RE.search(text[d_end:k_start]):
+                    continue
+                rank = (True, distance)
+            else:
+                continue
+            if best is None or rank < best[0]:
+                best = (rank, field, distance)
+        if best:
+            candidates[best[1]].append((iso, best[2]))
+    return candidates
+
+
+def _own_domain(email, host):
+    domain = email.split("@")[-1].lower()
+    return bool(host) and (domain == host or domain.endswith("." + host))
+
+
+def _extract_email(scraped, text, host):
+    # Contact links include footers (e.g. the web agency), so only own-domain addresses count as verified
+    emails = scraped.get("contacts", {}).get("emails", [])
+    own = [e for e in emails if _own_domain(e, host)]
+    if own:
+        return _hit(own[0], 0.95, "contact_link")
+    for node in _iter_json_ld(scraped.get("structured_data", {}).get("json_ld")):
+        if isinstance(node.get("email"), str):
+            return _hit(node["email"].replace("mailto:", "").strip().lower(), 0.9, "json_ld")
+    found = [e.lower() for e in EMAIL_RE.findall(text)]
+    own = [e for e in found if _own_domain(e, host)]
+    if own:
+        return _hit(own[0], 0.85, "regex")
+    # Foreign-domain addresses are only a hint for Veritic
+    if emails:
+        return _hit(emails[0], 0.7, "contact_link")
+    if found:
+        return _hit(found[0], 0.7, "regex")
+    return None
+
+
+def _extract_phone(scraped, text):
+    phones = scraped.get("contacts", {}).get("phones", [])
+    if phones:
+        return _hit(phones[0], 0.95, "contact_link")
+    for node in _iter_json_ld(scraped.get("structured_data", {}).get("json_ld")):
+        if isinstance(node.get("telephone"), str):
+            return _hit(node["telephone"].strip(), 0.9, "json_ld")
+    m = PHONE_RE.search(text)
+    if m:
+        return _hit(m.group(0).strip(), 0.6, "regex")
+    return None
+
+
+def _extract_director(scraped, text):
+    for node in _iter_json_ld(scraped.get("structured_data", {}).get("json_ld")):
+        if "person" in _ld_types(node) and re.search(r"director|principal|ředitel|riaditeľ", str(node.get("jobTitle", "")), re.I):
+            if isinstance(node.get("name"), str):
+                return _hit(node["name"].strip(), 0.9, "json_ld")
+    m = DIRECTOR_RE.search(text)
+    if m:
+        return _hit(m.group(1).strip(), 0.8, "regex")
+    return None
+
+
+def _extract_dated(scraped, candidates, ld_match):
+    for node in _iter_json_ld(scraped.get("structured_data", {}).get("json_ld")):
+        if "event" in _ld_types(node) and re.search(ld_match, _fold(str(node.get("name", "")))):
+            dates = parse_dates(str(node.get("startDate", "")))
+            if dates:
+                return _hit(dates[0], 0.9, "json_ld")
+    if not candidates:
+        return None
+    iso, distance = min(candidates, key=lambda c: c[1])
+    if len({c[0] for c in candidates}) > 1:
+        # Several dates for the same field (two open days, 1st/2nd round): the LLM decides
+        return _hit(iso, 0.6, "regex")
+    return _hit(iso, 0.85 if distance <= WINDOW // 3 else 0.7, "regex")
+
+
+def _extract_tuition(text):
+    for window in _windows(text, TUITION_KEYWORDS):
+        if re.search(r"\b(zdarma|bezplatn|free of charge)", _fold(window)):
+            return _hit("Free", 0.8, "regex")
+        amount = parse_amount(window)
+        if amount:
+            # Kept as a hint for Veritic, but below EXTRACT_MIN_CONFIDENCE
+            monthly = MONTHLY_RE.search(_fold(window))
+            return _hit(amount, 0.5 if monthly else 0.85, "regex")
+    return None
+
+
+def _negated(folded, start, end):
+    # Only the clause around the keyword: "nemáme bazén", "bazén není k dispozici"
+    before = re.split(r"[.!?;,]", folded[max(0, start - 40):start])[-1]
+    after = re.split(r"[.!?;,]", folded[end:end + 30])[0]
+    return bool(NEGATION_BEFORE_RE.search(before) or NEGATION_AFTER_RE.search(after))
+
+
+def _extract_facilities(text):
+    folded = _fold(text)
+    mentions = list(_keyword_spans(text, POOL_KEYWORDS))
+    if any(not _negated(folded, start, end) for start, end in mentions):
+        return _hit("Swimming pool", 0.8, "regex")
+    return None
+
+
+def extract_fields(scraped_data: dict):
+    """
+    Deterministic extraction of Veritic fields (+ phone) from scraped content.
+    Returns {field: {"value", "confidence", "source"}} for the fields that were found.
+    """
+    text = scraped_data.get("content_preview") or ""
+    addresses = scraped_data.get("structured_data", {}).get("addresses", [])
+    if addresses:
+        text = text + " " + " ".join(addresses)
+
+    host = re.sub(r"^www\.", "", re.sub(r"^[a-z]+://", "", (scraped_data.get("final_url") or scraped_data.get("url") or "").lower()).split("/")[0])
+
+    dated = _date_candidates(text)
+    results = {
+        "director": _extract_director(scraped_data, text),
+        "email": _extract_email(scraped_data, text, host),
+        "phone": _extract_phone(scraped_data, text),
+        "deadline": _extract_dated(scraped_data, dated["deadline"], r"prihlas|application|deadline|uzaverk"),
+        "tuition": _extract_tuition(text),
+        "open_day": _extract_dated(scraped_data, dated["open_day"], r"otevrenych|otvorenych|open (day|house)"),
+        "facilities": _extract_facilities(text),
+    }
+    return {field: hit for field, hit in results.items() if hit}
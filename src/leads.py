@@ -0,0 +1,255 @@
+import asyncio
+import json
+import os
+import re
+import unicodedata
+from urllib.parse import urlparse
+
+import pandas as pd
+import google.auth
+from google.auth.transport.requests import Request as GoogleAuthRequest
+import requests
+
+from src import config
+from src.models import generate_sync
+from src.telemetry import get_logger
+
+log = get_logger("leads")
+
+# Hosts that serve many unrelated sites under one domain (the path tells them apart)
+SHARED_HOSTS = (
+    "sites.google.com", "wixsite.com", "webnode.cz", "webnode.sk", "webnode.com", "blogspot.com",
+    "wordpress.com", "estranky.cz", "estranky.sk", "weebly.com", "github.io", "edupage.org",
+)
+
+def _get_credentials():
+    credentials, project_id = google.auth.default()
+    credentials.refresh(GoogleAuthRequest())
+
+    # Fallback for project_id if not detected automatically
+    if not project_id:
+        project_id = os.environ.get("GCP_PROJECT_ID") or os.environ.get("GOOGLE_CLOUD_PROJECT")
+
+    if not project_id:
+        raise Exception("Could not determine Google Cloud Project ID")
+
+    return credentials, project_id
+
+
+def _generate(credentials, project_id, prompt_text, model, search=True):
+    """Direct REST call to Vertex AI (grounded with Google Search by default)."""
+    location = config.VERTEX_LOCATION
+    url = f"https://{location}-aiplatform.googleapis.com/v1/projects/{project_id}/locations/{location}/publishers/google/models/{model}:generateContent"
+
+    headers = {
+        "Authorization": f"Bearer {credentials.token}",
+        "Content-Type": "application/json; charset=utf-8"
+    }
+
+    payload = {
+        "contents": [{ "role": "user", "parts": [{ "text": prompt_text }] }],
+        "generationConfig": { "temperature": 0.1 }
+    }
+    if search:
+        payload["tools"] = [{ "googleSearch": {} }]
+
+    response = requests.post(url, headers=headers, json=payload)
+    response.raise_for_status()
+
+    response_json = response.json()
+    try:
+        return response_json['candidates'][0]['content']['parts'][0]['text']
+    except (KeyError, IndexError):
+        log.error("Invalid Vertex response", extra={"response": response.text[:2000]})
+        raise ValueError("Invalid response structure from Vertex AI")
+
+
+def _parse_json_array(raw_text):
+    # Clean Markdown (removes ```json ... ```)
+    cleaned_text = raw_text.strip()
+    if cleaned_text.startswith("```json"):
+        cleaned_text = cleaned_text[7:]
+    elif cleaned_text.startswith("```"):
+        cleaned_text = cleaned_text[3:]
+    if cleaned_text.endswith("```"):
+        cleaned_text = cleaned_text[:-3]
+
+    try:
+        data = json.loads(cleaned_text)
+    except json.JSONDecodeError:
+        raise ValueError(f"AI returned invalid JSON: {cleaned_text}")
+
+    if not isinstance(data, list):
+        raise ValueError(f"AI returned JSON that is not an array: {cleaned_text}")
+    return data
+
+
+def normalize_lead(item):
+    # Map AI keys to Frontend keys
+    client_name = item.get('client_name') or item.get('name') or item.get('school') or item.get('title') or item.get('institution') or item.get('entity') or "Unknown"
+    url = item.get('url') or item.get('website') or item.get('link') or item.get('web') or "#"
+
+    return {
+        "client_name": client_name,
+        "url": url,
+        "industry": "Education", # Defaulting for context
+        "goals": "General Audit"
+    }
+
+
+def read_leads_file(source, filename):
+    """CSV/XLSX lead list (path or file object) -> normalized lead records."""
+    if filename.endswith('.csv'):
+        df = pd.read_csv(source)
+    elif filename.endswith(('.xls', '.xlsx')):
+        df = pd.read_excel(source)
+    else:
+        raise ValueError("Invalid file type")
+
+    # Normalize columns
+    df.columns = [c.lower() for c in df.columns]
+    # Rename common variations
+    rename_map = {
+        'name': 'client_name', 'company': 'client_name', 'institution': 'client_name',
+        'web': 'url', 'website': 'url', 'link': 'url'
+    }
+    df.rename(columns=rename_map, inplace=True)
+
+    # Fill missing
+    if 'goals' not in df.columns:
+        df['goals'] = "General Audit"
+    if 'industry' not in df.columns:
+        df['industry'] = "Unknown"
+
+    return df[['client_name', 'url', 'industry', 'goals']].to_dict(orient='records')
+
+
+def _normalize_name(name):
+    folded = unicodedata.normalize("NFKD", name or "").encode("ascii", "ignore").decode().lower()
+    return re.sub(r"[^a-z0-9]+", " ", folded).strip()
+
+
+def lead_key(lead):
+    """
+    De-duplication key. A homepage URL is keyed by the host alone, so gjk.cz and
+    https://www.gjk.cz/ merge whatever name the model gave. Hosting platforms are keyed by host + path,
+    and deep links on other hosts (e.g. school pages on a municipal portal) by
+    host + normalized name, so different institutions sharing a host stay apart.
+    """
+    name = _normalize_name(lead["client_name"])
+    if lead["url"] == "#":
+        return name
+    parsed = urlparse(lead["url"] if "://" in lead["url"] else f"https://{lead['url']}")
+    host = parsed.netloc.lower()
+    if host.startswith("www."):
+        host = host[4:]
+    if not host:
+        return name
+    path = re.sub(r"/(index\.\w+)?$", "", parsed.path.lower().rstrip("/"))
+    if any(host == h or host.endswith("." + h) for h in SHARED_HOSTS):
+        return f"{host}{path}"
+    if path:
+        return f"{host}|{name}"
+    return host
+
+
+def _search_prompt(query):
+    return f"""
+QUERY: {query}
+TASK: Search Google for the OFFICIAL websites.
+CONSTRAINT: Do NOT guess. If unsure, skip.
+OUTPUT FORMAT: You MUST return a strict JSON array of objects with exactly these keys: "client_name" and "url".
+EXAMPLE: [{{"client_name": "Gymnazium Jana Keplera", "url": "https://gjk.cz"}}]
+"""
+
+
+def _decompose_prompt(query, max_subqueries):
+    return f"""
+QUERY: {query}
+TASK: The QUERY is too broad for a single search. Split it into at most {max_subqueries} narrower search queries,
+one per region or city, that together cover the whole QUERY without overlapping.
+Keep the language and the type of institution from the QUERY.
+If the QUERY is already narrow (a single city or a handful of results), return it unchanged as the only item.
+OUTPUT FORMAT: You MUST return a strict JSON array of strings.
+EXAMPLE: ["Gymnázia v Praze", "Gymnázia ve Středočeském kraji", "Gymnázia v Jihomoravském kraji"]
+"""
+
+
+def search_leads(query, credentials=None, project_id=None):
+    """Single grounded call: one query -> list of normalized leads."""
+    if credentials is None:
+        credentials, project_id = _get_credentials()
+    # Flash first; escalates to the strong model when the answer is not a JSON array
+    leads = generate_sync(
+        "leads",
+        lambda model: _generate(credentials, project_id, _search_prompt(query), model),
+        check=lambda raw: ([normalize_lead(item) for item in _parse_json_array(raw) if isinstance(item, dict)], None)
+    )
+    if leads is None:
+        raise ValueError("AI returned no usable JSON array")
+    return leads
+
+
+def decompose_query(query, credentials, project_id, max_subqueries=None):
+    max_subqueries = max_subqueries or config.LEADS_MAX_SUBQUERIES
+    try:
+        subqueries = generate_sync(
+            "leads_decompose",
+            lambda model: _generate(credentials, project_id, _decompose_prompt(query, max_subqueries), model, search=False),
+            check=lambda raw: ([q.strip() for q in _parse_json_array(raw) if isinstance(q, str) and q.strip()], None)
+        )
+    except Exception as e:
+        log.warning("Query decomposition failed, running the prompt as-is", extra={"error": str(e)})
+        subqueries = []
+
+    # Preserve order, drop duplicates
+    subqueries = list(dict.fromkeys(subqueries or []))[:max_subqueries]
+    return subqueries or [query]
+
+
+async def fan_out_leads(query, concurrency=None):
+    """
+    Splits a broad prompt into sub-queries and runs them concurrently.
+    Yields events as they happen: plan -> leads (one per finished sub-query) -> done.
+    Leads are de-duplicated across sub-queries, so each lead is yielded only once.
+    """
+    concurrency = concurrency or config.LEADS_FANOUT_CONCURRENCY
+    credentials, project_id = await asyncio.to_thread(_get_credentials)
+    subqueries = await asyncio.to_thread(decompose_query, query, credentials, project_id)
+    yield {"type": "plan", "subqueries": subqueries}
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(subquery):
+        async with semaphore:
+            try:
+                return subquery, await asyncio.to_thread(search_leads, subquery, credentials, project_id), None
+            except Exception as e:
+                return subquery, [], str(e)
+
+    seen = set()
+    failed = 0
+    tasks = [asyncio.create_task(run(q)) for q in subqueries]
+    try:
+        for finished in asyncio.as_completed(tasks):
+            subquery, found, error = await finished
+            if error:
+                failed += 1
+                log.warning("Sub-query failed", extra={"subquery": subquery, "error": error})
+                yield {"type": "error", "subquery": subquery, "detail": error}
+                continue
+
+            new_leads = []
+            for lead in found:
+                key = lead_key(lead)
+                if key in seen:
+                    continue
+                seen.add(key)
+                new_leads.append(lead)
+            yield {"type": "leads", "subquery": subquery, "leads": new_leads}
+    finally:
+        # Client disconnected mid-stream -> don't leave sub-queries running
+        for task in tasks:
+            task.cancel()
+
+    yield {"type": "done", "total": len(seen), "subqueries": len(subqueries), "failed": failed}
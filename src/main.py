@@ -1,31 +1,86 @@
-from fastapi import FastAPI, HTTPException, UploadFile, File
-from fastapi.responses import HTMLResponse
+from fastapi import FastAPI, HTTPException, UploadFile, File, Request
+from fastapi.responses import HTMLResponse, StreamingResponse
 from pydantic import BaseModel
-from typing import List, Optional
-import pandas as pd
+from typing import List, Literal, Optional
 import io
 import json
 import asyncio
+import time
 from vertexai.generative_models import GenerativeModel, Tool, grounding
 # google.cloud.aiplatform_v1beta1 imports removed as they are no longer used in generate_leads
 # from google.cloud.aiplatform_v1beta1 import types as gapic_types
-from src.scraper import scrape_site
-from src.analyzer import analyze_universal
-
-# New imports for direct REST API call
-import google.auth
-from google.auth.transport.requests import Request as GoogleAuthRequest
-import requests
-import os
+from src import config
+from src.worker_pool import ScrapePool
+from src.admission import AdmissionController
+from src.snapshots import get_snapshot_store, archive_snapshot
+from src.results import get_results_store, persist_result
+from src.analyzer import run_audit, probe_rimlab_batch
+from src.leads import search_leads, fan_out_leads, read_leads_file
+from src.models import generate, tier_stats
+from src.telemetry import get_logger, new_trace, set_campaign, setup_logging, span
+
+# JSON logs via a background thread (Cloud Logging picks up severity + trace)
+setup_logging()
+log = get_logger("api")
 
 app = FastAPI()
 
+# Scraping runs in separate worker processes, off the API event loop
+scrape_pool = ScrapePool()
+admission = AdmissionController()
+
+# Raw page snapshots for replay-mode re-analysis (None when SNAPSHOT_BACKEND is unset)
+snapshot_store = get_snapshot_store()
+background_tasks = set()
+
+# Completed audits for the /results analytics (None when RESULTS_DIR is empty)
+results_store = get_results_store()
+
+@app.on_event("startup")
+async def start_scrape_pool():
+    scrape_pool.start()
+    if results_store:
+        results_store.start()
+
+@app.on_event("shutdown")
+async def stop_scrape_pool():
+    scrape_pool.shutdown()
+    if results_store:
+        await asyncio.to_thread(results_store.close)
+
+@app.middleware("http")
+async def request_context(request: Request, call_next):
+    # One trace per request; reuse Cloud Run's trace id so our logs join the request log
+    cloud_trace = request.headers.get("x-cloud-trace-context", "").split("/")[0]
+    ctx = new_trace(request_id=request.headers.get("x-request-id"), trace_id=cloud_trace or None)
+    started = time.monotonic()
+    with span(f"{request.method} {request.url.path}") as attrs:
+        response = await call_next(request)
+        attrs["status_code"] = response.status_code
+    response.headers["X-Request-ID"] = ctx["request_id"]
+    log.info("Request finished", extra={
+        "method": request.method,
+        "path": request.url.path,
+        "status": response.status_code,
+        "latency_ms": round((time.monotonic() - started) * 1000, 1)
+    })
+    return response
+
 # --- Data Models ---
 class AuditRequest(BaseModel):
     url: str
     client_name: str
     industry: str
     goals: str
+    rimlab_result: Optional[dict] = None # Pre-computed by /rimlab-batch
+    # Scheduling class: one-off audits stay fast while campaigns share the rest
+    priority: Literal["interactive", "campaign", "background"] = "interactive"
+    campaign_id: Optional[str] = None
+
+class RimlabBatchRequest(BaseModel):
+    clients: List[str]
+    priority: Literal["interactive", "campaign", "background"] = "campaign"
+    campaign_id: Optional[str] = None
 
 class GeneratorRequest(BaseModel):
     prompt: str
@@ -104,6 +159,10 @@ HTML_APP = """
             <div id="content-ai" class="glass p-6 rounded-2xl">
                 <label class="block text-xs text-slate-400 uppercase font-bold mb-2">Prompt for Leads</label>
                 <textarea id="aiPrompt" rows="3" class="w-full bg-slate-900 border border-slate-700 rounded-lg p-3 text-sm text-white focus:ring-2 focus:ring-green-500 outline-none" placeholder="Find 5 high schools in Prague..."></textarea>
+                <label class="flex items-center mt-3 text-xs text-slate-400 cursor-pointer">
+                    <input type="checkbox" id="aiFanOut" class="mr-2 accent-green-500">
+                    Fan-out mode (split by region/city, stream results)
+                </label>
                 <button onclick="generateLeads()" class="w-full mt-4 bg-green-600 hover:bg-green-500 text-white font-bold py-2 rounded-lg transition">
                     <i class="fas fa-magic mr-2"></i> Generate Leads
                 </button>
@@ -338,6 +397,23 @@ HTML_APP = """
         }
 
         let leads = [];
+        const MAX_OVERLOAD_RETRIES = 5;
+        const RIMLAB_BATCH_SIZE = __RIMLAB_BATCH_SIZE__;
+
+        // One /rimlab-batch request per chunk of leads; never rejects (a lead without an answer runs its own RimLab)
+        async function prefetchRimlab(chunk, campaignId) {
+            try {
+                const res = await fetch('/rimlab-batch', {
+                    method: 'POST',
+                    headers: {'Content-Type': 'application/json'},
+                    body: JSON.stringify({ clients: chunk.map(l => l.client_name), campaign_id: campaignId })
+                });
+                if (res.ok) {
+                    const answers = await res.json();
+                    chunk.forEach(l => { l.rimlab_result = answers[l.client_name] || null; });
+                }
+            } catch (e) { /* falls back to per-audit RimLab */ }
+        }
 
         function switchTab(tab) {
             document.querySelectorAll('[id^="content-"]').forEach(el => el.classList.add('hidden'));
@@ -357,6 +433,11 @@ HTML_APP = """
             btn.innerHTML = '<i class="fas fa-spinner fa-spin"></i> Working...';
             
             try {
+                if (document.getElementById('aiFanOut').checked) {
+                    await generateLeadsStream(prompt, btn);
+                    return;
+                }
+
                 const res = await fetch('/generate-leads', {
                     method: 'POST',
                     headers: {'Content-Type': 'application/json'},
@@ -371,6 +452,40 @@ HTML_APP = """
             }
         }
 
+        async function generateLeadsStream(prompt, btn) {
+            const res = await fetch('/generate-leads/stream', {
+                method: 'POST',
+                headers: {'Content-Type': 'application/json'},
+                body: JSON.stringify({ prompt })
+            });
+            if(!res.ok) throw new Error("Failed");
+
+            loadTable([]);
+            let planned = 0, finished = 0;
+            const reader = res.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = '';
+
+            while (true) {
+                const { done, value } = await reader.read();
+                if (done) break;
+                buffer += decoder.decode(value, { stream: true });
+
+                // One JSON event per line
+                const lines = buffer.split('\\n');
+                buffer = lines.pop();
+                for (const line of lines) {
+                    if (!line.trim()) continue;
+                    const event = JSON.parse(line);
+                    if (event.type === 'plan') planned = event.subqueries.length;
+                    if (event.type === 'leads') appendLeads(event.leads);
+                    if (event.type === 'leads' || (event.type === 'error' && event.subquery)) finished++;
+                    if (event.type === 'error' && !event.subquery) alert(event.detail);
+                    btn.innerHTML = `<i class="fas fa-spinner fa-spin"></i> ${finished}/${planned} queries, ${leads.length} leads`;
+                }
+            }
+        }
+
         async function uploadLeads() {
             const fileInput = document.getElementById('csvInput');
             if(fileInput.files.length === 0) return alert("Select a file");
@@ -388,6 +503,13 @@ HTML_APP = """
             } catch(e) { alert(e); }
         }
 
+        function appendLeads(data) {
+            leads = leads.concat(data.map(d => ({...d, status: 'Ready', result: null})));
+            renderTable();
+            document.getElementById('btnStart').disabled = leads.length === 0;
+            document.getElementById('queueCount').innerText = leads.length;
+        }
+
         function loadTable(data) {
             leads = data.map(d => ({...d, status: 'Ready', result: null}));
             renderTable();
@@ -401,6 +523,7 @@ HTML_APP = """
             leads.forEach((lead, idx) => {
                 let statusColor = 'text-slate-400';
                 if(lead.status === 'Processing') statusColor = 'text-blue-400 animate-pulse';
+                if(lead.status === 'Waiting') statusColor = 'text-yellow-400';
                 if(lead.status === 'Done') statusColor = 'text-green-400';
                 if(lead.status === 'Error') statusColor = 'text-red-400';
 
@@ -423,10 +546,36 @@ HTML_APP = """
             btn.disabled = true;
             const originalText = btn.innerHTML;
             btn.innerHTML = '<i class="fas fa-spinner fa-spin"></i> Working...';
+            const campaignId = 'ui-' + Date.now();
+            // A single lead is a one-off audit: it gets the interactive class (and its reserved slot)
+            const priority = leads.filter(l => l.status !== 'Done').length === 1 ? 'interactive' : 'campaign';
+
+            // RimLab in batched calls instead of one per lead, one chunk per request so no request
+            // runs long. Each chunk is fetched while the previous one is being audited.
+            const pending = leads.filter(l => l.status !== 'Done' && !l.rimlab_result);
+            const chunks = [];
+            if (pending.length > 1) {
+                for (let start = 0; start < pending.length; start += RIMLAB_BATCH_SIZE) {
+                    chunks.push({ leads: pending.slice(start, start + RIMLAB_BATCH_SIZE), ready: null });
+                }
+            }
+            const chunkOf = new Map();
+            chunks.forEach((chunk, k) => chunk.leads.forEach(l => chunkOf.set(l, k)));
+            const prefetch = k => {
+                if (k < chunks.length && !chunks[k].ready) chunks[k].ready = prefetchRimlab(chunks[k].leads, campaignId);
+                return chunks[k] && chunks[k].ready;
+            };
 
             for (let i = 0; i < leads.length; i++) {
                 if(leads[i].status === 'Done') continue;
 
+                if (chunkOf.has(leads[i])) {
+                    const k = chunkOf.get(leads[i]);
+                    const ready = prefetch(k);
+                    prefetch(k + 1);
+                    await ready;
+                }
+
                 leads[i].status = 'Processing';
                 renderTable();
 
@@ -438,10 +587,25 @@ HTML_APP = """
                             url: leads[i].url,
                             client_name: leads[i].client_name,
                             industry: leads[i].industry || 'General',
-                            goals: leads[i].goals || 'Analyze reputation'
+                            goals: leads[i].goals || 'Analyze reputation',
+                            rimlab_result: leads[i].rimlab_result || null,
+                            priority: priority,
+                            campaign_id: campaignId
                         })
                     });
 
+                    // Server is shedding load: wait as instructed and retry the same lead, a few times at most
+                    if(res.status === 503) {
+                        leads[i].retries = (leads[i].retries || 0) + 1;
+                        if(leads[i].retries > MAX_OVERLOAD_RETRIES) throw new Error("Server overloaded");
+                        const wait = parseInt(res.headers.get('Retry-After') || '5', 10);
+                        leads[i].status = 'Waiting';
+                        renderTable();
+                        await new Promise(r => setTimeout(r, wait * 1000));
+                        i--;
+                        continue;
+                    }
+
                     if(!res.ok) throw new Error("Failed");
 
                     const result = await res.json();
@@ -452,6 +616,7 @@ HTML_APP = """
 
                 } catch (e) {
                     leads[i].status = 'Error';
+                    leads[i].retries = 0; // a later run starts over
                     renderTable();
                 }
             }
@@ -509,7 +674,7 @@ HTML_APP = """
 
             // Veritic
             const v = data.veritic_result;
-            document.getElementById('veriticScore').innerText = v.integrity_score + "/100";
+            document.getElementById('veriticScore').innerText = (v.integrity_score ?? 'n/a') + "/100";
             
             const vMissing = document.getElementById('veriticMissing');
             vMissing.innerHTML = '';
@@ -533,7 +698,7 @@ HTML_APP = """
 
             // Choice
             const c = data.choice_result;
-            document.getElementById('choiceScore').innerText = c.brand_score + "/100";
+            document.getElementById('choiceScore').innerText = (c.brand_score ?? 'n/a') + "/100";
             document.getElementById('choiceArchetype').innerText = c.archetype;
             document.getElementById('choiceAlignment').innerText = '"' + c.alignment_analysis + '"';
 
@@ -551,112 +716,119 @@ HTML_APP = """
 
 @app.get("/", response_class=HTMLResponse)
 async def read_root():
-    return HTML_APP
+    return HTML_APP.replace("__RIMLAB_BATCH_SIZE__", str(config.RIMLAB_BATCH_SIZE))
 
 @app.post("/audit")
 async def perform_audit(request: AuditRequest):
-    scraped_data = await scrape_site(request.url)
-    if not scraped_data:
-         # Fallback if scraping fails, analysis might still want to run on empty data or handle it
-         scraped_data = {"content_preview": "", "title": "Scraping Failed", "url": request.url}
-    
-    result = await analyze_universal(scraped_data, request.dict())
-    return result
+    set_campaign(request.campaign_id)
+    # Rejects with 503 + Retry-After when saturated instead of risking OOM
+    async with admission.admit(request.priority, request.campaign_id):
+
+        async def scrape():
+            scraped_data = await scrape_pool.scrape(request.url)
+            if not scraped_data:
+                 # Fallback if scraping fails, analysis might still want to run on empty data or handle it
+                 return {"content_preview": "", "title": "Scraping Failed", "url": request.url}
+            if snapshot_store:
+                # Archive in the background, the audit does not wait for the upload
+                task = asyncio.create_task(archive_snapshot(snapshot_store, scraped_data, request.dict()))
+                background_tasks.add(task)
+                task.add_done_callback(background_tasks.discard)
+            return scraped_data
+
+        # RimLab starts right away and runs while the page is still being scraped
+        result = await run_audit(request.dict(), scrape, rimlab_result=request.rimlab_result)
+        if results_store:
+            # Row is buffered right away; the occasional Parquet flush happens off the response path
+            task = asyncio.create_task(persist_result(results_store, result, request.dict(), request.campaign_id))
+            background_tasks.add(task)
+            task.add_done_callback(background_tasks.discard)
+        return result
+
+@app.post("/rimlab-batch")
+async def rimlab_batch(req: RimlabBatchRequest):
+    # {client_name: rimlab_result} for at most RIMLAB_BATCH_SIZE clients (one model call),
+    # so a request never outlives the request timeout; callers send larger lists in chunks
+    if len(req.clients) > config.RIMLAB_BATCH_SIZE:
+        raise HTTPException(status_code=413, detail=f"At most {config.RIMLAB_BATCH_SIZE} clients per request")
+    set_campaign(req.campaign_id)
+    async with admission.admit(req.priority, req.campaign_id):
+        try:
+            return await probe_rimlab_batch(req.clients)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/admission/stats")
+async def admission_stats():
+    return {
+        "admission": admission.stats(),
+        "scrape_pool": scrape_pool.stats()
+    }
+
+@app.get("/models/stats")
+async def models_stats():
+    # Calls, p50/p95 latency per tier and escalation rate per task
+    return tier_stats.stats()
+
+def _results():
+    if results_store is None:
+        raise HTTPException(status_code=404, detail="Results store is disabled (RESULTS_DIR)")
+    return results_store
+
+async def _results_query(method, *args, **kwargs):
+    # Vectorized, but still keep pandas work off the event loop
+    try:
+        return await asyncio.to_thread(method, *args, **kwargs)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/results/distribution")
+async def results_distribution(column: str = "integrity_score", bins: int = 10, campaign: Optional[str] = None,
+                               domain: Optional[str] = None, since: Optional[str] = None, until: Optional[str] = None):
+    # Histogram + quantiles for scores, value counts for categories (archetype, verdict_level, ...)
+    return await _results_query(_results().distribution, column, bins=bins, campaign=campaign,
+                                domain=domain, since=since, until=until)
+
+@app.get("/results/top")
+async def results_top(metric: str = "integrity_score", group_by: str = "archetype", n: int = 10,
+                      order: Literal["asc", "desc"] = "desc", min_count: int = 1, campaign: Optional[str] = None,
+                      domain: Optional[str] = None, since: Optional[str] = None, until: Optional[str] = None):
+    # e.g. archetypes with the worst alignment: metric=brand_score&group_by=archetype&order=asc
+    return await _results_query(_results().top, metric, group_by, n=n, ascending=order == "asc",
+                                min_count=min_count, campaign=campaign, domain=domain, since=since, until=until)
+
+@app.get("/results/trend")
+async def results_trend(metric: str = "integrity_score", freq: str = "week", group_by: Optional[str] = None,
+                        campaign: Optional[str] = None, domain: Optional[str] = None,
+                        since: Optional[str] = None, until: Optional[str] = None):
+    return await _results_query(_results().trend, metric, freq=freq, group_by=group_by, campaign=campaign,
+                                domain=domain, since=since, until=until)
 
 @app.post("/generate-leads")
 async def generate_leads(req: GeneratorRequest):
     try:
-        # Get credentials
-        credentials, project_id = google.auth.default()
-        auth_req = GoogleAuthRequest()
-        credentials.refresh(auth_req)
-
-        # Fallback for project_id if not detected automatically
-        if not project_id:
-             project_id = os.environ.get("GCP_PROJECT_ID") or os.environ.get("GOOGLE_CLOUD_PROJECT")
-
-        if not project_id:
-            raise Exception("Could not determine Google Cloud Project ID")
-
-        # Hardcode region as requested
-        location = "us-central1"
-
-        # Construct URL
-        url = f"https://us-central1-aiplatform.googleapis.com/v1/projects/{project_id}/locations/{location}/publishers/google/models/gemini-2.5-pro:generateContent"
-
-        headers = {
-            "Authorization": f"Bearer {credentials.token}",
-            "Content-Type": "application/json; charset=utf-8"
-        }
-
-        prompt_text = f"""
-QUERY: {req.prompt}
-TASK: Search Google for the OFFICIAL websites.
-CONSTRAINT: Do NOT guess. If unsure, skip.
-OUTPUT FORMAT: You MUST return a strict JSON array of objects with exactly these keys: "client_name" and "url".
-EXAMPLE: [{{"client_name": "Gymnazium Jana Keplera", "url": "https://gjk.cz"}}]
-"""
-
-        # Construct raw JSON payload
-        payload = {
-            "contents": [{ "role": "user", "parts": [{ "text": prompt_text }] }],
-            "tools": [{ "googleSearch": {} }],
-            "generationConfig": { "temperature": 0.1 }
-        }
-
-        # Make the request
-        response = requests.post(url, headers=headers, json=payload)
-        response.raise_for_status()
-
-        # 1. Parse the Vertex AI JSON structure
-        response_json = response.json()
-        try:
-            # Extract the text content
-            raw_text = response_json['candidates'][0]['content']['parts'][0]['text']
-        except (KeyError, IndexError):
-            print(f"Vertex Error: {response.text}")
-            raise HTTPException(status_code=500, detail="Invalid response structure from Vertex AI")
-
-        # 2. Clean Markdown (removes ```json ... ```)
-        cleaned_text = raw_text.strip()
-        if cleaned_text.startswith("```json"):
-            cleaned_text = cleaned_text[7:]
-        elif cleaned_text.startswith("```"):
-            cleaned_text = cleaned_text[3:]
-        if cleaned_text.endswith("```"):
-            cleaned_text = cleaned_text[:-3]
-
-        # 3. Parse string to List
-        try:
-            data = json.loads(cleaned_text)
-        except json.JSONDecodeError:
-            raise HTTPException(status_code=500, detail=f"AI returned invalid JSON: {cleaned_text}")
-
-        # 4. CRITICAL: Normalize Keys for Frontend
-        normalized_data = []
-        for item in data:
-            # Map AI keys to Frontend keys
-            client_name = item.get('client_name') or item.get('name') or item.get('school') or item.get('title') or item.get('institution') or item.get('entity') or "Unknown"
-            url = item.get('url') or item.get('website') or item.get('link') or item.get('web') or "#"
-
-            normalized_data.append({
-                "client_name": client_name,
-                "url": url,
-                "industry": "Education", # Defaulting for context
-                "goals": "General Audit"
-            })
-
-        return normalized_data
-
+        return await asyncio.to_thread(search_leads, req.prompt)
     except Exception as e:
         # Ensure we log the error for debugging
-        print(f"Error in generate_leads: {str(e)}")
+        log.error("Error in generate_leads", extra={"error": str(e)})
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/generate-leads/stream")
+async def generate_leads_stream(req: GeneratorRequest):
+    # Fan-out mode: one NDJSON event per line, leads arrive as each sub-query finishes
+    async def events():
+        try:
+            async for event in fan_out_leads(req.prompt):
+                yield json.dumps(event, ensure_ascii=False) + "\n"
+        except Exception as e:
+            log.error("Error in generate_leads_stream", extra={"error": str(e)})
+            yield json.dumps({"type": "error", "detail": str(e)}) + "\n"
+
+    return StreamingResponse(events(), media_type="application/x-ndjson")
+
 @app.post("/support-chat")
 async def support_chat(req: ChatRequest):
     try:
-        model = GenerativeModel("gemini-2.5-pro")
         system_prompt = """Jsi technická podpora pro aplikaci Veritic Intelligence Hub.
         Tvým úkolem je vysvětlovat uživatelům, jak systém funguje.
 
@@ -671,38 +843,28 @@ async def support_chat(req: ChatRequest):
         Odpovídej stručně, nápomocně a pouze v Češtině."""
 
         full_prompt = f"{system_prompt}\n\nDOTAZ UŽIVATELE: {req.message}"
-        response = await model.generate_content_async(full_prompt)
-        return {"reply": response.text}
+
+        async def call(name):
+            response = await GenerativeModel(name).generate_content_async(full_prompt)
+            return response.text
+
+        # FAQ replies stay on the fast tier unless it comes back empty
+        reply = await generate(
+            "support_chat", call,
+            check=lambda text: (text, None if text and text.strip() else ("schema", "empty reply"))
+        )
+        return {"reply": reply}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/upload-leads")
 async def upload_leads(file: UploadFile = File(...)):
+    if not file.filename.endswith(('.csv', '.xls', '.xlsx')):
+        raise HTTPException(status_code=400, detail="Invalid file type")
+
     try:
         contents = await file.read()
-        if file.filename.endswith('.csv'):
-            df = pd.read_csv(io.BytesIO(contents))
-        elif file.filename.endswith(('.xls', '.xlsx')):
-            df = pd.read_excel(io.BytesIO(contents))
-        else:
-            raise HTTPException(status_code=400, detail="Invalid file type")
-
-        # Normalize columns
-        df.columns = [c.lower() for c in df.columns]
-        # Rename common variations
-        rename_map = {
-            'name': 'client_name', 'company': 'client_name', 'institution': 'client_name',
-            'web': 'url', 'website': 'url', 'link': 'url'
-        }
-        df.rename(columns=rename_map, inplace=True)
-
-        # Fill missing
-        if 'goals' not in df.columns:
-            df['goals'] = "General Audit"
-        if 'industry' not in df.columns:
-            df['industry'] = "Unknown"
-
-        return df[['client_name', 'url', 'industry', 'goals']].to_dict(orient='records')
+        return read_leads_file(io.BytesIO(contents), file.filename)
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
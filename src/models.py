@@ -0,0 +1,129 @@
+import time
+from collections import deque
+
+from src import config
+from src.telemetry import get_logger, span
+
+log = get_logger("models")
+
+# Cheapest first; escalation walks up this list
+TIERS = ["fast", "strong"]
+
+
+def model_name(tier):
+    return config.MODEL_STRONG if tier == "strong" else config.MODEL_FAST
+
+
+def route(task):
+    """Tiers to try for a task: its configured starting tier and everything above it."""
+    start = config.MODEL_ROUTES.get(task, "fast")
+    if start not in TIERS:
+        log.warning("Unknown model tier in MODEL_ROUTES, using fast", extra={"task": task, "tier": start})
+        start = "fast"
+    tiers = TIERS[TIERS.index(start):]
+    return tiers if config.MODEL_ESCALATION else tiers[:1]
+
+
+def model_for(task):
+    """Model name of the starting tier (for callers that cannot escalate, e.g. offline batch)."""
+    return model_name(route(task)[0])
+
+
+class TierStats:
+    """Calls, latency and escalations per task and tier, for /models/stats."""
+
+    def __init__(self):
+        self.calls = {}
+        self.escalations = {}
+        self._latencies = {}
+
+    def record_call(self, task, tier, seconds):
+        key = (task, tier)
+        self.calls[key] = self.calls.get(key, 0) + 1
+        self._latencies.setdefault(key, deque(maxlen=200)).append(seconds)
+
+    def record_escalation(self, task, reason):
+        key = (task, reason)
+        self.escalations[key] = self.escalations.get(key, 0) + 1
+
+    def stats(self):
+        stats = {}
+        for (task, tier), calls in sorted(self.calls.items()):
+            latencies = sorted(self._latencies[(task, tier)])
+            entry = stats.setdefault(task, {"tiers": {}, "escalations": {}, "escalation_rate": 0.0})
+            entry["tiers"][tier] = {
+                "model": model_name(tier),
+                "calls": calls,
+                "latency_p50_s": round(latencies[len(latencies) // 2], 3),
+                "latency_p95_s": round(latencies[int(0.95 * (len(latencies) - 1))], 3),
+            }
+        for (task, reason), count in self.escalations.items():
+            entry = stats.setdefault(task, {"tiers": {}, "escalations": {}, "escalation_rate": 0.0})
+            entry["escalations"][reason] = count
+        for task, entry in stats.items():
+            # Share of requests that had to go past their starting tier
+            first = entry["tiers"].get(route(task)[0], {}).get("calls", 0)
+            entry["escalation_rate"] = round(sum(entry["escalations"].values()) / first, 3) if first else 0.0
+        return stats
+
+
+tier_stats = TierStats()
+
+
+def _accept(task, tier, tiers, problem):
+    """True when the answer is final: valid, or there is no tier left to try."""
+    if problem is None:
+        return True
+    reason, detail = problem
+    if tier == tiers[-1]:
+        log.warning("Model answer failed validation on the last tier", extra={
+            "task": task, "tier": tier, "reason": reason, "detail": detail
+        })
+        return True
+    tier_stats.record_escalation(task, reason)
+    log.info("Escalating to a stronger model", extra={"task": task, "from_tier": tier, "reason": reason, "detail": detail})
+    return False
+
+
+async def generate(task, call, check=None):
+    """
+    Runs call(model_name) -> raw answer on the task's tiers, cheapest first.
+    check(raw) parses the answer and returns (result, problem), where problem is
+    None or (reason, detail) with reason "schema", "low_confidence" or
+    "inconsistent". Parse errors raised by check count as "schema" (result None).
+    On the last tier the answer is returned as parsed even when it failed its
+    check, so callers must cope with None; API errors are not retried here.
+    """
+    tiers = route(task)
+    for tier in tiers:
+        name = model_name(tier)
+        with span(f"model.{task}", model=name, tier=tier):
+            started = time.monotonic()
+            raw = await call(name)
+            tier_stats.record_call(task, tier, time.monotonic() - started)
+        result, problem = _validate(raw, check)
+        if _accept(task, tier, tiers, problem):
+            return result
+
+
+def generate_sync(task, call, check=None):
+    """generate() for blocking callers (the leads REST client runs in threads)."""
+    tiers = route(task)
+    for tier in tiers:
+        name = model_name(tier)
+        with span(f"model.{task}", model=name, tier=tier):
+            started = time.monotonic()
+            raw = call(name)
+            tier_stats.record_call(task, tier, time.monotonic() - started)
+        result, problem = _validate(raw, check)
+        if _accept(task, tier, tiers, problem):
+            return result
+
+
+def _validate(raw, check):
+    if check is None:
+        return raw, None
+    try:
+        return check(raw)
+    except (ValueError, KeyError, TypeError, AttributeError) as e:
+        return None, ("schema", str(e)[:300])
@@ -0,0 +1,44 @@
+import asyncio
+import inspect
+
+from src.telemetry import span
+
+
+class TaskGraph:
+    """
+    Tiny async dependency graph: every step starts as soon as the steps it
+    depends on have finished, independent steps run concurrently. A step gets
+    the results of its dependencies as positional arguments, in deps order.
+    """
+
+    def __init__(self):
+        self._steps = {}
+
+    def add(self, name, fn, deps=()):
+        # Dependencies must be added first, which also rules out cycles
+        missing = [d for d in deps if d not in self._steps]
+        if missing:
+            raise ValueError(f"Step {name!r} depends on unknown steps {missing}")
+        self._steps[name] = (fn, tuple(deps))
+
+    async def run(self):
+        """Runs all steps, returns {name: result}. The first failure cancels the rest."""
+        tasks = {}
+
+        async def run_step(name, fn, deps):
+            args = [await tasks[d] for d in deps]
+            with span(f"pipeline.{name}"):
+                result = fn(*args)
+                return await result if inspect.isawaitable(result) else result
+
+        for name, (fn, deps) in self._steps.items():
+            tasks[name] = asyncio.create_task(run_step(name, fn, deps))
+        try:
+            results = await asyncio.gather(*tasks.values())
+        except BaseException:
+            for task in tasks.values():
+                task.cancel()
+            # Let the cancelled steps unwind before the caller moves on
+            await asyncio.gather(*tasks.values(), return_exceptions=True)
+            raise
+        return dict(zip(tasks, results))
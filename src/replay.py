@@ -0,0 +1,96 @@
+import argparse
+import asyncio
+import json
+import time
+
+from src import config
+from src.analyzer import analyze_universal
+from src.snapshots import LocalSnapshotStore, GCSSnapshotStore, get_snapshot_store
+from src.telemetry import new_trace, setup_logging, span
+
+# Replay mode: re-runs analyze_universal over archived snapshots instead of re-scraping.
+#   python -m src.replay --since 2026-10-01 --concurrency 16 -o replay.jsonl
+# Only the model calls touch the network, so prompt changes can be compared quickly and cheaply.
+
+
+async def replay(store, output_path, concurrency=16, since=None, until=None, url_contains=None, limit=None):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    # Refs are small files, but on GCS each one is a round trip: fetch them concurrently off the event loop
+    async def load_ref(key):
+        async with semaphore:
+            return await asyncio.to_thread(store.load_ref, key)
+
+    keys = await asyncio.to_thread(store.ref_keys, since, until)
+    print(f"Loading {len(keys)} snapshot refs")
+
+    # Newest ref per (snapshot, brief) pair; the same page audited twice is analyzed once
+    refs = {}
+    for ref in await asyncio.gather(*[load_ref(key) for key in keys]):
+        if url_contains and url_contains not in (ref.get("url") or ""):
+            continue
+        refs[(ref["id"], json.dumps(ref.get("brief"), sort_keys=True))] = ref
+    refs = list(refs.values())[:limit] if limit else list(refs.values())
+    print(f"Replaying {len(refs)} snapshots with concurrency {concurrency}")
+
+    started = time.monotonic()
+    done = 0
+
+    async def run(ref, out):
+        nonlocal done
+        async with semaphore:
+            new_trace(request_id=ref["id"][:16])
+            try:
+                with span("replay.analyze", snapshot_id=ref["id"], url=ref["url"]):
+                    scraped_data = await asyncio.to_thread(store.load, ref["id"])
+                    brief = ref.get("brief") or {"client_name": scraped_data.get("title"), "url": ref["url"]}
+                    result = await analyze_universal(scraped_data, brief)
+                error = None
+            except Exception as e:
+                result, error = None, str(e)
+
+            out.write(json.dumps({
+                "snapshot_id": ref["id"],
+                "url": ref["url"],
+                "scraped_at": ref["scraped_at"],
+                "brief": ref.get("brief"),
+                "result": result,
+                "error": error
+            }, ensure_ascii=False) + "\n")
+            done += 1
+            if done % 25 == 0 or done == len(refs):
+                rate = done / (time.monotonic() - started)
+                print(f"[{done}/{len(refs)}] {rate * 60:.1f} snapshots/min")
+
+    with open(output_path, "w", encoding="utf-8") as out:
+        await asyncio.gather(*[run(ref, out) for ref in refs])
+    print(f"Replay results -> {output_path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-run the analyzer over archived page snapshots (no scraping).")
+    parser.add_argument("--output", "-o", default="replay.jsonl")
+    parser.add_argument("--concurrency", "-c", type=int, default=16)
+    parser.add_argument("--since", help="First scrape day to include (yyyy-mm-dd)")
+    parser.add_argument("--until", help="Last scrape day to include (yyyy-mm-dd)")
+    parser.add_argument("--url-contains", help="Only snapshots whose URL contains this text")
+    parser.add_argument("--limit", type=int)
+    parser.add_argument("--local-dir", help="Read snapshots from this directory instead of SNAPSHOT_BACKEND")
+    parser.add_argument("--gcs-bucket", help="Read snapshots from this bucket instead of SNAPSHOT_BACKEND")
+    args = parser.parse_args()
+    setup_logging()
+
+    if args.local_dir:
+        store = LocalSnapshotStore(args.local_dir)
+    elif args.gcs_bucket:
+        store = GCSSnapshotStore(args.gcs_bucket, config.SNAPSHOT_GCS_PREFIX)
+    else:
+        store = get_snapshot_store()
+    if store is None:
+        parser.error("No snapshot store: set SNAPSHOT_BACKEND or pass --local-dir / --gcs-bucket")
+
+    asyncio.run(replay(store, args.output, args.concurrency, args.since, args.until, args.url_contains, args.limit))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+import os
+import time
+
+# Container resource readings (cgroup v2, then v1, then the host), shared by
+# admission control and the scrape pool sizing.
+
+
+def _read_int(path):
+    try:
+        with open(path) as f:
+            value = f.read().strip()
+        return None if value == "max" else int(value)
+    except (OSError, ValueError):
+        return None
+
+
+def _stat(path, key):
+    try:
+        with open(path) as f:
+            for line in f:
+                name, value = line.split()
+                if name == key:
+                    return int(value)
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def memory_percent():
+    """
+    Container working set in % of its limit (cgroup v2, then v1, then the whole
+    host). Inactive page cache (Chromium's disk cache, snapshot and Parquet
+    writes) is reclaimable and not counted, as in Kubernetes' working set.
+    """
+    for used_path, limit_path, stat_path, inactive_key in (
+        ("/sys/fs/cgroup/memory.current", "/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory.stat", "inactive_file"),
+        ("/sys/fs/cgroup/memory/memory.usage_in_bytes", "/sys/fs/cgroup/memory/memory.limit_in_bytes",
+         "/sys/fs/cgroup/memory/memory.stat", "total_inactive_file"),
+    ):
+        used, limit = _read_int(used_path), _read_int(limit_path)
+        # v1 reports an absurdly large limit when unlimited
+        if used is not None and limit and limit < 1 << 60:
+            working_set = max(0, used - (_stat(stat_path, inactive_key) or 0))
+            return 100.0 * working_set / limit
+
+    try:
+        meminfo = {}
+        with open("/proc/meminfo") as f:
+            for line in f:
+                key, value = line.split(":", 1)
+                meminfo[key] = int(value.split()[0])
+        return 100.0 * (1 - meminfo["MemAvailable"] / meminfo["MemTotal"])
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def available_cores():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def cpu_limit():
+    """CPUs the container may use: cgroup quota (v2, then v1), else the CPUs this process may run on."""
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()
+        if quota != "max":
+            return int(quota) / int(period)
+    except (OSError, ValueError):
+        quota, period = _read_int("/sys/fs/cgroup/cpu/cpu.cfs_quota_us"), _read_int("/sys/fs/cgroup/cpu/cpu.cfs_period_us")
+        if quota and quota > 0 and period:
+            return quota / period
+    return float(available_cores())
+
+
+def _cgroup_cpu_seconds():
+    usage = _stat("/sys/fs/cgroup/cpu.stat", "usage_usec")
+    if usage is not None:
+        return usage / 1e6
+    for path in ("/sys/fs/cgroup/cpuacct/cpuacct.usage", "/sys/fs/cgroup/cpu,cpuacct/cpuacct.usage"):
+        usage = _read_int(path)
+        if usage is not None:
+            return usage / 1e9
+    return None
+
+
+_cpu_sample = None
+
+
+def load_per_core():
+    """
+    Share of the container's CPU allowance used since the previous call (cgroup
+    usage / cpu_limit()). Without cgroup accounting falls back to the 1-minute
+    load average over the CPUs this process may run on.
+    """
+    global _cpu_sample
+    used, now = _cgroup_cpu_seconds(), time.monotonic()
+    if used is not None:
+        if _cpu_sample is None:
+            _cpu_sample = (now, used, None)
+        elif now - _cpu_sample[0] >= 0.5:
+            # Shorter windows (e.g. /admission/stats right after a check) reuse the last value
+            _cpu_sample = (now, used, (used - _cpu_sample[1]) / (now - _cpu_sample[0]) / cpu_limit())
+        return _cpu_sample[2]
+    try:
+        return os.getloadavg()[0] / available_cores()
+    except (OSError, AttributeError):
+        return None
@@ -0,0 +1,379 @@
+import argparse
+import asyncio
+import glob
+import os
+import threading
+import time
+import uuid
+from urllib.parse import urlparse
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+from src import config
+from src.telemetry import get_logger, setup_logging
+
+log = get_logger("results")
+
+# Completed audits as one flat row each, kept in memory as a DataFrame for
+# vectorized queries and persisted as Parquet parts:
+#   <RESULTS_DIR>/<yyyy-mm-dd>/part-<time>-<id>.parquet
+# Small parts from past days are merged into one file per day by a single job:
+#   python -m src.results compact
+
+CATEGORICAL = ["campaign_id", "domain", "industry", "archetype", "verdict_level", "source"]
+NUMERIC = ["integrity_score", "brand_score", "missing_count"]
+COLUMNS = (["audit_id", "completed_at", "url", "client_name", "missing_fields", "ai_director", "error"]
+           + CATEGORICAL + NUMERIC)
+FREQUENCIES = {"day": "D", "week": "W-MON", "month": "MS"}
+
+
+def _domain(url):
+    host = urlparse(url if "://" in (url or "") else f"https://{url}").netloc.lower()
+    return host[4:] if host.startswith("www.") else host
+
+
+def audit_row(result, brief, campaign_id=None, source="api"):
+    """Flattens an analyze/run_audit result into one store row."""
+    veritic = result.get("veritic_result") or {}
+    choice = result.get("choice_result") or {}
+    error = bool((result.get("metadata") or {}).get("error"))
+    # A failed part (metadata.failed) leaves its own columns empty, the rest of the row stays
+    veritic_error, choice_error = error or bool(veritic.get("error")), error or bool(choice.get("error"))
+    missing = [str(m) for m in veritic.get("missing_data") or []]
+    verdict = result.get("layman_verdict") or ""
+    return {
+        "audit_id": uuid.uuid4().hex,
+        "completed_at": pd.Timestamp.now(tz="UTC"),
+        "campaign_id": campaign_id or "",
+        "domain": _domain(brief.get("url") or ""),
+        "url": brief.get("url"),
+        "client_name": brief.get("client_name"),
+        "industry": brief.get("industry"),
+        "source": source,
+        "error": error,
+        "integrity_score": np.nan if veritic_error else pd.to_numeric(veritic.get("integrity_score"), errors="coerce"),
+        "brand_score": np.nan if choice_error else pd.to_numeric(choice.get("brand_score"), errors="coerce"),
+        "missing_count": np.nan if veritic_error else len(missing),
+        "missing_fields": ",".join(missing),
+        "archetype": choice.get("archetype") or "",
+        "verdict_level": verdict.split(":", 1)[0] if ":" in verdict else "",
+        "ai_director": str((result.get("rimlab_result") or {}).get("ai_director") or ""),
+    }
+
+
+def _typed(df):
+    # Categoricals keep group-bys and equality filters fast and the frame small
+    df = df.reindex(columns=COLUMNS)
+    for column in CATEGORICAL:
+        df[column] = df[column].fillna("").astype(str).astype("category")
+    for column in NUMERIC:
+        df[column] = pd.to_numeric(df[column], errors="coerce").astype("float64")
+    df["completed_at"] = pd.to_datetime(df["completed_at"], utc=True)
+    df["error"] = df["error"].fillna(False).astype(bool)
+    return df
+
+
+def _concat(frame, new):
+    # union_categoricals keeps the category dtype without re-encoding the whole frame
+    combined = pd.concat([frame.drop(columns=CATEGORICAL), new.drop(columns=CATEGORICAL)], ignore_index=True)
+    for column in CATEGORICAL:
+        combined[column] = union_categoricals([frame[column], new[column]], ignore_order=True)
+    return combined[COLUMNS]
+
+
+def _dedupe(df):
+    return df.drop_duplicates("audit_id", ignore_index=True)
+
+
+def _merge(frame, new):
+    # A part may be read back after its rows arrived via append(), or seen both before and after compaction
+    return _concat(frame, _dedupe(new[~new["audit_id"].isin(frame["audit_id"])]))
+
+
+class ResultsStore:
+    """
+    Append-only audit results. append() only buffers; rows are written as a new
+    Parquet part once RESULTS_FLUSH_ROWS are pending or the oldest is
+    RESULTS_FLUSH_SECONDS old (checked on append and, after start(), by a
+    background timer, so a quiet instance does not sit on rows), and on close().
+
+    Several instances may share RESULTS_DIR: queries re-list the part files at
+    most every RESULTS_REFRESH_SECONDS and pick up other writers' parts, and
+    rows are de-duplicated by audit_id. Compaction is not done here but by one
+    job (python -m src.results compact), so instances never race on it.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self._lock = threading.Lock()
+        self._frame = _typed(pd.DataFrame(columns=COLUMNS))
+        self._new_rows = []       # appended, not yet merged into _frame
+        self._unflushed = []      # appended, not yet on disk
+        self._oldest_unflushed = None
+        self._paths = set()       # part files already in _frame
+        self._listed_at = 0.0
+        self._stopped = threading.Event()
+        self._flusher = None
+        self.load()
+
+    def _list(self):
+        return set(glob.glob(os.path.join(self.root, "*", "*.parquet")))
+
+    @staticmethod
+    def _read(paths):
+        frames = []
+        for path in sorted(paths):
+            try:
+                frames.append(pd.read_parquet(path))
+            except FileNotFoundError:
+                # Merged into a compacted file since the listing; that file is read instead
+                continue
+        return _typed(pd.concat(frames, ignore_index=True)) if frames else None
+
+    def load(self):
+        """(Re)reads every part file; rows appended here but not flushed yet are kept."""
+        paths = self._list()
+        frame = self._read(paths)
+        with self._lock:
+            self._frame = _typed(pd.DataFrame(columns=COLUMNS)) if frame is None else _dedupe(frame)
+            if self._unflushed:
+                self._frame = _merge(self._frame, _typed(pd.DataFrame(self._unflushed)))
+            self._new_rows = []
+            self._paths = paths
+            self._listed_at = time.monotonic()
+        log.info("Results store loaded", extra={"root": self.root, "rows": len(self._frame), "files": len(paths)})
+
+    def refresh(self, force=False):
+        """Picks up part files written by other instances since the last listing."""
+        if not force and time.monotonic() - self._listed_at < config.RESULTS_REFRESH_SECONDS:
+            return
+        paths = self._list()
+        if self._paths - paths:
+            # Parts we read were merged by compaction: re-read everything rather than track the move
+            return self.load()
+        added = paths - self._paths
+        frame = self._read(added) if added else None
+        with self._lock:
+            if frame is not None:
+                self._frame = _merge(self._frame, frame)
+            self._paths |= added
+            self._listed_at = time.monotonic()
+
+    def compact(self, min_files=None):
+        """Merges past days' part files into one file per day. Run from a single job only."""
+        min_files = min_files or config.RESULTS_COMPACT_FILES
+        today = time.strftime("%Y-%m-%d", time.gmtime())
+        by_day = {}
+        for path in sorted(self._list()):
+            by_day.setdefault(os.path.basename(os.path.dirname(path)), []).append(path)
+        compacted = 0
+        for day, parts in by_day.items():
+            if day >= today or len(parts) < min_files:
+                continue
+            merged = self._read(parts)
+            if merged is None:
+                continue
+            self._write(day, _dedupe(merged), "compacted")
+            for path in parts:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            compacted += 1
+        log.info("Results store compacted", extra={"root": self.root, "days": compacted})
+        return compacted
+
+    def _write(self, day, df, label="part"):
+        directory = os.path.join(self.root, day)
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{label}-{int(time.time() * 1000)}-{uuid.uuid4().hex[:8]}.parquet")
+        df.to_parquet(path + ".tmp", index=False)
+        os.replace(path + ".tmp", path)
+        return path
+
+    def append(self, row):
+        with self._lock:
+            self._new_rows.append(row)
+            self._unflushed.append(row)
+            if self._oldest_unflushed is None:
+                self._oldest_unflushed = time.monotonic()
+
+    def flush_due(self):
+        return bool(self._unflushed) and (
+            len(self._unflushed) >= config.RESULTS_FLUSH_ROWS
+            or time.monotonic() - self._oldest_unflushed >= config.RESULTS_FLUSH_SECONDS
+        )
+
+    def start(self):
+        """Starts the background timer flush (idempotent)."""
+        if self._flusher is None:
+            self._flusher = threading.Thread(target=self._run_flusher, name="results-flusher", daemon=True)
+            self._flusher.start()
+
+    def close(self):
+        """Stops the timer and writes whatever is still buffered. Blocking."""
+        self._stopped.set()
+        if self._flusher is not None:
+            self._flusher.join(timeout=5)
+            self._flusher = None
+        self.flush()
+
+    def _run_flusher(self):
+        interval = max(1.0, config.RESULTS_FLUSH_SECONDS / 4)
+        while not self._stopped.wait(interval):
+            try:
+                if self.flush_due():
+                    self.flush()
+            except Exception as e:
+                log.warning("Results store flush failed, retrying later", extra={"error": str(e)})
+
+    def flush(self):
+        """Writes buffered rows as Parquet parts (one per UTC day). Blocking."""
+        with self._lock:
+            rows, self._unflushed, self._oldest_unflushed = self._unflushed, [], None
+        if not rows:
+            return
+        df = _typed(pd.DataFrame(rows))
+        try:
+            for day, part in df.groupby(df["completed_at"].dt.strftime("%Y-%m-%d")):
+                path = self._write(day, part)
+                # Its rows are in _frame already (via append)
+                with self._lock:
+                    self._paths.add(path)
+        except Exception:
+            # Keep the rows for the next attempt
+            with self._lock:
+                self._unflushed = rows + self._unflushed
+                self._oldest_unflushed = self._oldest_unflushed or time.monotonic()
+            raise
+
+    def frame(self):
+        """All rows (including unflushed ones and other instances' parts) as a typed DataFrame."""
+        self.refresh()
+        with self._lock:
+            if self._new_rows:
+                new = _typed(pd.DataFrame(self._new_rows))
+                self._new_rows = []
+                self._frame = _merge(self._frame, new)
+            return self._frame
+
+    # --- Queries (all vectorized over the in-memory frame) ---
+
+    def select(self, campaign=None, domain=None, since=None, until=None, include_errors=False):
+        """Rows filtered by campaign / domain / inclusive yyyy-mm-dd date range."""
+        df = self.frame()
+        mask = np.ones(len(df), dtype=bool)
+        if not include_errors:
+            mask &= ~df["error"].to_numpy()
+        if campaign is not None:
+            mask &= (df["campaign_id"] == campaign).to_numpy()
+        if domain is not None:
+            mask &= (df["domain"] == _domain(domain)).to_numpy()
+        if since:
+            mask &= (df["completed_at"] >= pd.Timestamp(since, tz="UTC")).to_numpy()
+        if until:
+            mask &= (df["completed_at"] < pd.Timestamp(until, tz="UTC") + pd.Timedelta(days=1)).to_numpy()
+        return df[mask]
+
+    def distribution(self, column, bins=10, **filters):
+        df = self.select(**filters)
+        if column in NUMERIC:
+            values = df[column].dropna().to_numpy()
+            value_range = (0, 100) if column != "missing_count" else None
+            counts, edges = np.histogram(values, bins=bins, range=value_range)
+            quantiles = [round(float(q), 2) for q in np.quantile(values, [0.1, 0.5, 0.9])] if len(values) else [None] * 3
+            return {
+                "column": column,
+                "count": int(len(values)),
+                "mean": round(float(values.mean()), 2) if len(values) else None,
+                "p10": quantiles[0], "median": quantiles[1], "p90": quantiles[2],
+                "histogram": [
+                    {"from": round(float(lo), 2), "to": round(float(hi), 2), "count": int(c)}
+                    for lo, hi, c in zip(edges[:-1], edges[1:], counts)
+                ],
+            }
+        if column in CATEGORICAL:
+            counts = df[column].value_counts(sort=True)
+            counts = counts[counts > 0].head(50)
+            return {
+                "column": column,
+                "count": int(len(df)),
+                "values": [{"value": value, "count": int(c), "share": round(c / len(df), 4)} for value, c in counts.items()],
+            }
+        raise ValueError(f"Unknown column {column!r}, use one of {NUMERIC + CATEGORICAL}")
+
+    def top(self, metric, group_by, n=10, ascending=False, min_count=1, **filters):
+        self._check(metric, group_by)
+        df = self.select(**filters)
+        grouped = df.groupby(group_by, observed=True)[metric].agg(["mean", "count"])
+        grouped = grouped[grouped["count"] >= min_count].sort_values("mean", ascending=ascending).head(n)
+        return {
+            "metric": metric,
+            "group_by": group_by,
+            "rows": [{group_by: key, "mean": round(float(row["mean"]), 2), "count": int(row["count"])}
+                     for key, row in grouped.iterrows()],
+        }
+
+    def trend(self, metric, freq="week", group_by=None, **filters):
+        self._check(metric, group_by)
+        if freq not in FREQUENCIES:
+            raise ValueError(f"Unknown freq {freq!r}, use one of {list(FREQUENCIES)}")
+        df = self.select(**filters)
+        # Periods are labelled by their first day
+        keys = [pd.Grouper(key="completed_at", freq=FREQUENCIES[freq], label="left", closed="left")] + ([group_by] if group_by else [])
+        grouped = df.groupby(keys, observed=True)[metric].agg(["mean", "count"]).reset_index()
+        grouped = grouped[grouped["count"] > 0]
+        return {
+            "metric": metric,
+            "freq": freq,
+            "group_by": group_by,
+            "rows": [
+                {"period": row["completed_at"].strftime("%Y-%m-%d"),
+                 **({group_by: row[group_by]} if group_by else {}),
+                 "mean": round(float(row["mean"]), 2), "count": int(row["count"])}
+                for _, row in grouped.iterrows()
+            ],
+        }
+
+    @staticmethod
+    def _check(metric, group_by):
+        if metric not in NUMERIC:
+            raise ValueError(f"Unknown metric {metric!r}, use one of {NUMERIC}")
+        if group_by is not None and group_by not in CATEGORICAL:
+            raise ValueError(f"Unknown group_by {group_by!r}, use one of {CATEGORICAL}")
+
+
+def get_results_store():
+    """Store under RESULTS_DIR, or None when persisting results is off."""
+    return ResultsStore(config.RESULTS_DIR) if config.RESULTS_DIR else None
+
+
+async def persist_result(store, result, brief, campaign_id=None, source="api"):
+    """Records a finished audit; store problems never fail the audit."""
+    try:
+        store.append(audit_row(result, brief, campaign_id, source))
+        if store.flush_due():
+            await asyncio.to_thread(store.flush)
+    except Exception as e:
+        log.warning("Results store error", extra={"url": brief.get("url"), "error": str(e)})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintenance of the Parquet audit results store.")
+    parser.add_argument("command", choices=["compact"])
+    parser.add_argument("--dir", default=config.RESULTS_DIR, help="Store directory (default: RESULTS_DIR)")
+    parser.add_argument("--min-files", type=int, default=config.RESULTS_COMPACT_FILES,
+                        help="Merge a past day once it has at least this many part files")
+    args = parser.parse_args()
+    setup_logging()
+    if not args.dir:
+        parser.error("No store directory: set RESULTS_DIR or pass --dir")
+
+    days = ResultsStore(args.dir).compact(args.min_files)
+    print(f"Compacted {days} day(s) in {args.dir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+import asyncio
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+
+from src import config
+from src.telemetry import get_logger
+
+log = get_logger("scheduler")
+
+# Lower rank = served first
+PRIORITIES = {"interactive": 0, "campaign": 1, "background": 2}
+
+
+class _Waiter:
+    __slots__ = ("future", "priority", "campaign", "enqueued_at")
+
+    def __init__(self, future, priority, campaign):
+        self.future = future
+        self.priority = priority
+        self.campaign = campaign
+        self.enqueued_at = time.monotonic()
+
+
+class PriorityScheduler:
+    """
+    Hands out a fixed number of audit slots by priority class.
+
+    - Each class can reserve slots that other classes may not take, so a
+      salesperson's interactive audit never waits behind a full campaign.
+    - Inside a class, campaigns are served round-robin, so one huge campaign
+      does not block a small one queued after it.
+    - Waiting time ages a request towards a better rank (one class per
+      aging_seconds), so background work is delayed but never starved.
+      Aging must be faster than the queue timeout, otherwise a request times
+      out before it could overtake anything; it is capped at
+      queue_timeout / len(PRIORITIES).
+    """
+
+    def __init__(self, slots=None, reserved=None, aging_seconds=None, queue_timeout=None):
+        self.slots = slots or config.ADMISSION_MAX_IN_FLIGHT
+        self.reserved = reserved if reserved is not None else {
+            "interactive": config.SCHEDULER_RESERVED_INTERACTIVE,
+            "campaign": config.SCHEDULER_RESERVED_CAMPAIGN,
+            "background": 0,
+        }
+        queue_timeout = queue_timeout or config.ADMISSION_QUEUE_TIMEOUT
+        max_aging = queue_timeout / len(PRIORITIES)
+        self.aging_seconds = aging_seconds or config.SCHEDULER_AGING_SECONDS or max_aging
+        if self.aging_seconds > max_aging:
+            log.warning("Scheduler: aging slower than the queue timeout, capping it", extra={
+                "aging_seconds": self.aging_seconds, "queue_timeout": queue_timeout, "capped_to": max_aging
+            })
+            self.aging_seconds = max_aging
+        if sum(self.reserved.values()) >= self.slots:
+            # Keep at least one slot that any class can use
+            log.warning("Scheduler: reservations exceed slots, ignoring them", extra={
+                "reserved": self.reserved, "slots": self.slots
+            })
+            self.reserved = {p: 0 for p in PRIORITIES}
+
+        self.running = {p: 0 for p in PRIORITIES}
+        # priority -> campaign -> waiters, plus the round-robin order of campaigns
+        self._queues = {p: {} for p in PRIORITIES}
+        self._rotation = {p: deque() for p in PRIORITIES}
+        self._waits = {p: deque(maxlen=200) for p in PRIORITIES}
+
+    def waiting(self, priority=None):
+        priorities = [priority] if priority else PRIORITIES
+        return sum(len(q) for p in priorities for q in self._queues[p].values())
+
+    def _free(self):
+        return self.slots - sum(self.running.values())
+
+    def _can_run(self, priority):
+        # Slots still reserved for the other classes (only the part they are not using)
+        held_back = sum(
+            max(0, self.reserved.get(p, 0) - self.running[p]) for p in PRIORITIES if p != priority
+        )
+        return self._free() - held_back > 0
+
+    def _head(self, priority):
+        rotation = self._rotation[priority]
+        return self._queues[priority][rotation[0]][0] if rotation else None
+
+    def _dispatch(self):
+        now = time.monotonic()
+        while self._free() > 0:
+            candidates = []
+            for priority, rank in PRIORITIES.items():
+                head = self._head(priority)
+                if head is not None and self._can_run(priority):
+                    aged_rank = rank - (now - head.enqueued_at) / self.aging_seconds
+                    candidates.append((aged_rank, head.enqueued_at, priority))
+            if not candidates:
+                return
+
+            _, _, priority = min(candidates)
+            waiter = self._pop(priority)
+            if waiter.future.done():
+                # Timed out / cancelled while its removal was still pending
+                continue
+            self.running[priority] += 1
+            self._waits[priority].append(now - waiter.enqueued_at)
+            waiter.future.set_result(None)
+
+    def _pop(self, priority):
+        rotation = self._rotation[priority]
+        campaign = rotation.popleft()
+        queue = self._queues[priority][campaign]
+        waiter = queue.popleft()
+        if queue:
+            rotation.append(campaign)
+        else:
+            del self._queues[priority][campaign]
+        return waiter
+
+    def _remove(self, waiter):
+        queue = self._queues[waiter.priority].get(waiter.campaign)
+        if queue is None or waiter not in queue:
+            return
+        queue.remove(waiter)
+        if not queue:
+            del self._queues[waiter.priority][waiter.campaign]
+            self._rotation[waiter.priority].remove(waiter.campaign)
+
+    async def acquire(self, priority="interactive", campaign=None, timeout=None):
+        """Waits for a slot; raises asyncio.TimeoutError after timeout seconds."""
+        waiter = _Waiter(asyncio.get_running_loop().create_future(), priority, campaign or "")
+        queue = self._queues[priority].setdefault(waiter.campaign, deque())
+        if not queue:
+            self._rotation[priority].append(waiter.campaign)
+        queue.append(waiter)
+
+        # Free slot -> granted synchronously, no need to wait at all
+        self._dispatch()
+        if waiter.future.done():
+            return
+        try:
+            await asyncio.wait_for(waiter.future, timeout)
+        except BaseException:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # Granted just as we gave up: hand the slot back
+                self.release(priority)
+            else:
+                self._remove(waiter)
+            raise
+
+    def release(self, priority):
+        self.running[priority] -= 1
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, priority="interactive", campaign=None, timeout=None):
+        await self.acquire(priority, campaign, timeout)
+        try:
+            yield
+        finally:
+            self.release(priority)
+
+    def stats(self):
+        stats = {}
+        for priority in PRIORITIES:
+            waits = sorted(self._waits[priority])
+            stats[priority] = {
+                "running": self.running[priority],
+                "waiting": self.waiting(priority),
+                "reserved": self.reserved.get(priority, 0),
+                "campaigns_waiting": len(self._rotation[priority]),
+                "wait_p95_s": round(waits[int(0.95 * (len(waits) - 1))], 3) if waits else 0.0,
+            }
+        return stats
@@ -1,39 +1,143 @@
 from playwright.async_api import async_playwright
 
-async def scrape_site(url: str):
-    async with async_playwright() as p:
-        browser = await p.chromium.launch(headless=True)
-        # Pre istotu emulujeme desktop, aby sme nedostali mobilnú verziu
-        context = await browser.new_context(viewport={"width": 1920, "height": 1080})
-        page = await context.new_page()
-        
-        try:
-            print(f"Scraping URL: {url}")
-            await page.goto(url, timeout=30000, wait_until="domcontentloaded")
-            
-            # Získame kľúčové dáta
-            title = await page.title()
-            
-            # Skúsime nájsť meta popis
-            description = "No description found"
-            try:
-                description = await page.locator('meta[name="description"]').get_attribute("content")
-            except:
-                pass
-
-            # Získame čistý text (pre AI analýzu)
-            body_text = await page.locator('body').inner_text()
-            
-            await browser.close()
-            
-            return {
-                "url": url,
-                "title": title,
-                "description": description,
-                "content_preview": body_text[:5000] # Limit pre demo
+from src import config
+from src.telemetry import get_logger, span
+
+log = get_logger("scraper")
+
+# Jediný round-trip do prehliadača: všetko vytiahneme naraz a orežeme ešte v stránke,
+# aby sa obrovské stránky nikdy celé neserializovali do Pythonu.
+# Text zbierame cez TreeWalker (bez layoutu, na rozdiel od innerText), skryté časti preskočíme.
+EXTRACT_SCRIPT = """
+({ maxChars, maxItems, maxBlockChars, maxHtmlChars }) => {
+    const clean = (s) => (s || '').replace(/\\s+/g, ' ').trim();
+    const uniq = (list) => [...new Set(list.filter(Boolean))].slice(0, maxItems);
+    const meta = (sel) => {
+        const el = document.querySelector(sel);
+        return el ? clean(el.getAttribute('content')) : null;
+    };
+
+    // Contact links (before stripping, footers often hold them)
+    const hrefs = (prefix) => Array.from(document.querySelectorAll(`a[href^="${prefix}" i]`))
+        .map(a => {
+            const raw = a.getAttribute('href').slice(prefix.length).split('?')[0];
+            try { return clean(decodeURIComponent(raw)); } catch (e) { return clean(raw); }
+        });
+
+    // Structured data
+    const jsonLd = [];
+    for (const el of Array.from(document.querySelectorAll('script[type="application/ld+json"]')).slice(0, maxItems)) {
+        const raw = (el.textContent || '').slice(0, maxBlockChars);
+        try { jsonLd.push(JSON.parse(raw)); } catch (e) { /* truncated or invalid */ }
+    }
+    const openGraph = {};
+    for (const el of Array.from(document.querySelectorAll('meta[property^="og:"]')).slice(0, maxItems)) {
+        openGraph[el.getAttribute('property').slice(3)] = clean(el.getAttribute('content')).slice(0, maxBlockChars);
+    }
+    const addresses = uniq(Array.from(document.querySelectorAll('address'))
+        .map(el => clean(el.textContent).slice(0, maxBlockChars)));
+
+    // Main content without boilerplate: text nodes in document order, with a space
+    // wherever the block container changes, so minified <li>a</li><li>b</li> stays "a b".
+    // Hidden and boilerplate subtrees are rejected whole (no layout is forced).
+    const root = document.querySelector('main, [role="main"]') || document.body;
+    const SKIP = 'script, style, noscript, template, svg, iframe, nav, footer, [role="navigation"], [hidden], [aria-hidden="true"]';
+    const INLINE = new Set(['A', 'ABBR', 'B', 'BDI', 'BDO', 'CITE', 'CODE', 'DATA', 'DFN', 'EM', 'FONT', 'I', 'KBD',
+        'LABEL', 'MARK', 'Q', 'S', 'SAMP', 'SMALL', 'SPAN', 'STRONG', 'SUB', 'SUP', 'TIME', 'U', 'VAR']);
+    const blockOf = (node) => {
+        let el = node.parentElement;
+        while (el && el !== root && INLINE.has(el.tagName)) el = el.parentElement;
+        return el;
+    };
+    let text = '';
+    if (root) {
+        const parts = [];
+        let length = 0;
+        let prevBlock = null;
+        const walker = document.createTreeWalker(root, NodeFilter.SHOW_ELEMENT | NodeFilter.SHOW_TEXT, {
+            acceptNode: (node) => {
+                if (node.nodeType === Node.TEXT_NODE || node.tagName === 'BR') return NodeFilter.FILTER_ACCEPT;
+                return node.matches(SKIP) ? NodeFilter.FILTER_REJECT : NodeFilter.FILTER_SKIP;
             }
-            
-        except Exception as e:
-            print(f"Error scraping {url}: {e}")
-            await browser.close()
-            return None
+        });
+        while (length < maxChars && walker.nextNode()) {
+            const node = walker.currentNode;
+            if (node.nodeType !== Node.TEXT_NODE) {
+                parts.push(' ');
+                continue;
+            }
+            const block = blockOf(node);
+            if (block !== prevBlock) parts.push(' ');
+            prevBlock = block;
+            parts.push(node.nodeValue);
+            length += node.nodeValue.length;
+        }
+        text = clean(parts.join('')).slice(0, maxChars);
+    }
+
+    return {
+        // Raw HTML only for the snapshot archive (maxHtmlChars = 0 -> not serialized at all)
+        html: maxHtmlChars ? document.documentElement.outerHTML.slice(0, maxHtmlChars) : null,
+        final_url: location.href,
+        title: clean(document.title),
+        description: meta('meta[name="description" i]') || meta('meta[property="og:description"]'),
+        text,
+        contacts: {
+            emails: uniq(hrefs('mailto:').map(e => e.toLowerCase())),
+            phones: uniq(hrefs('tel:')),
+        },
+        structured_data: {
+            json_ld: jsonLd,
+            open_graph: openGraph,
+            addresses,
+        },
+    };
+}
+"""
+
+async def scrape_site(url: str, browser=None):
+    # Bez prehliadača od volajúceho si spustíme vlastný (a po sebe ho zavrieme)
+    if browser is None:
+        async with async_playwright() as p:
+            browser = await p.chromium.launch(headless=True)
+            try:
+                return await scrape_site(url, browser)
+            finally:
+                await browser.close()
+
+    # Pre istotu emulujeme desktop, aby sme nedostali mobilnú verziu
+    context = await browser.new_context(viewport={"width": 1920, "height": 1080})
+    page = await context.new_page()
+
+    try:
+        log.info("Scraping URL", extra={"url": url})
+        with span("scrape.navigate", url=url):
+            await page.goto(url, timeout=30000, wait_until="domcontentloaded")
+
+        # Získame kľúčové dáta (title, meta, čistý text, kontakty, štruktúrované dáta)
+        with span("scrape.extract", url=url) as attrs:
+            extracted = await page.evaluate(EXTRACT_SCRIPT, {
+                "maxChars": config.SCRAPE_MAX_TEXT_CHARS,
+                "maxItems": config.SCRAPE_MAX_ITEMS,
+                "maxBlockChars": config.SCRAPE_MAX_BLOCK_CHARS,
+                "maxHtmlChars": config.SNAPSHOT_MAX_HTML_CHARS if config.SNAPSHOT_BACKEND else 0,
+            })
+            attrs["text_chars"] = len(extracted["text"])
+
+        return {
+            "url": url,
+            "final_url": extracted["final_url"],
+            "title": extracted["title"],
+            "description": extracted["description"] or "No description found",
+            "content_preview": extracted["text"],
+            "contacts": extracted["contacts"],
+            "structured_data": extracted["structured_data"],
+            "html": extracted["html"]
+        }
+
+    except Exception as e:
+        log.warning("Error scraping URL", extra={"url": url, "error": str(e)})
+        return None
+
+    finally:
+        await context.close()
@@ -0,0 +1,166 @@
+import abc
+import asyncio
+import gzip
+import hashlib
+import json
+import os
+import time
+
+from src import config
+from src.telemetry import get_logger
+
+log = get_logger("snapshots")
+
+# Raw page snapshots, content-addressed:
+#   blobs/<id[:2]>/<id>.json.gz        gzip of the scraped page (HTML + extracted text), id = sha256
+#   refs/<yyyy-mm-dd>/<url hash>-<hhmmss.mmm>-<brief hash>-<id>.json   one per scrape: url, time and the audit brief
+# Re-scraping an unchanged page only adds a ref, the blob is stored once.
+
+SNAPSHOT_FIELDS = ["url", "final_url", "title", "description", "content_preview", "contacts", "structured_data", "html"]
+
+
+def _digest(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class SnapshotStore(abc.ABC):
+    """Storage-agnostic snapshot logic; backends implement the four blob methods."""
+
+    @abc.abstractmethod
+    def _put(self, key: str, data: bytes):
+        ...
+
+    @abc.abstractmethod
+    def _get(self, key: str) -> bytes:
+        ...
+
+    @abc.abstractmethod
+    def _exists(self, key: str) -> bool:
+        ...
+
+    @abc.abstractmethod
+    def _list(self, prefix: str):
+        ...
+
+    def save(self, scraped_data: dict, brief: dict = None):
+        """Archives one scrape, returns its snapshot id."""
+        page = {field: scraped_data.get(field) for field in SNAPSHOT_FIELDS}
+        canonical = json.dumps(page, ensure_ascii=False, sort_keys=True)
+        snapshot_id = _digest(canonical)
+
+        blob_key = f"blobs/{snapshot_id[:2]}/{snapshot_id}.json.gz"
+        if not self._exists(blob_key):
+            # mtime=0 keeps the compressed bytes deterministic too
+            self._put(blob_key, gzip.compress(canonical.encode("utf-8"), mtime=0))
+
+        now = time.time()
+        brief = {k: v for k, v in (brief or {}).items() if k in ("client_name", "industry", "goals", "url")}
+        ref = {
+            "id": snapshot_id,
+            "url": page["url"],
+            "scraped_at": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(now)),
+            "brief": brief
+        }
+        # Time and brief in the key: every audit of a page keeps its own ref, even on the same day
+        stamp = f"{time.strftime('%H%M%S', time.localtime(now))}.{int(now * 1000) % 1000:03d}"
+        brief_hash = _digest(json.dumps(brief, ensure_ascii=False, sort_keys=True))[:8]
+        ref_key = (f"refs/{time.strftime('%Y-%m-%d', time.localtime(now))}/"
+                   f"{_digest(page['url'] or '')[:16]}-{stamp}-{brief_hash}-{snapshot_id}.json")
+        self._put(ref_key, json.dumps(ref, ensure_ascii=False).encode("utf-8"))
+        return snapshot_id
+
+    def load(self, snapshot_id: str):
+        return json.loads(gzip.decompress(self._get(f"blobs/{snapshot_id[:2]}/{snapshot_id}.json.gz")))
+
+    def ref_keys(self, since: str = None, until: str = None):
+        """Ref keys, oldest day first (a page's refs oldest first); since/until are inclusive yyyy-mm-dd."""
+        keys = []
+        for key in self._list("refs/"):
+            day = key.split("/")[1]
+            if (since and day < since) or (until and day > until):
+                continue
+            keys.append(key)
+        return sorted(keys)
+
+    def load_ref(self, key: str):
+        return json.loads(self._get(key))
+
+    def refs(self, since: str = None, until: str = None):
+        for key in self.ref_keys(since, until):
+            yield self.load_ref(key)
+
+
+class LocalSnapshotStore(SnapshotStore):
+
+    def __init__(self, root):
+        self.root = root
+
+    def _path(self, key):
+        return os.path.join(self.root, *key.split("/"))
+
+    def _put(self, key, data):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def _get(self, key):
+        with open(self._path(key), "rb") as f:
+            return f.read()
+
+    def _exists(self, key):
+        return os.path.exists(self._path(key))
+
+    def _list(self, prefix):
+        base = self._path(prefix)
+        for dirpath, _, filenames in os.walk(base):
+            for name in filenames:
+                if not name.endswith(".tmp"):
+                    yield os.path.relpath(os.path.join(dirpath, name), self.root).replace(os.sep, "/")
+
+
+class GCSSnapshotStore(SnapshotStore):
+
+    def __init__(self, bucket, prefix="snapshots"):
+        from google.cloud import storage
+        self.bucket = storage.Client().bucket(bucket)
+        self.prefix = prefix.strip("/")
+
+    def _key(self, key):
+        return f"{self.prefix}/{key}" if self.prefix else key
+
+    def _put(self, key, data):
+        self.bucket.blob(self._key(key)).upload_from_string(data)
+
+    def _get(self, key):
+        return self.bucket.blob(self._key(key)).download_as_bytes()
+
+    def _exists(self, key):
+        return self.bucket.blob(self._key(key)).exists()
+
+    def _list(self, prefix):
+        strip = len(self.prefix) + 1 if self.prefix else 0
+        for blob in self.bucket.list_blobs(prefix=self._key(prefix)):
+            yield blob.name[strip:]
+
+
+def get_snapshot_store():
+    """Store configured by SNAPSHOT_BACKEND, or None when archiving is off."""
+    if config.SNAPSHOT_BACKEND == "local":
+        return LocalSnapshotStore(config.SNAPSHOT_LOCAL_DIR)
+    if config.SNAPSHOT_BACKEND == "gcs":
+        if not config.SNAPSHOT_GCS_BUCKET:
+            raise ValueError("SNAPSHOT_GCS_BUCKET is required for the gcs snapshot backend")
+        return GCSSnapshotStore(config.SNAPSHOT_GCS_BUCKET, config.SNAPSHOT_GCS_PREFIX)
+    return None
+
+
+async def archive_snapshot(store, scraped_data, brief=None):
+    """Saves a scrape off the event loop; archiving problems never fail the audit."""
+    try:
+        return await asyncio.to_thread(store.save, scraped_data, brief)
+    except Exception as e:
+        log.warning("Snapshot archive error", extra={"url": scraped_data.get("url"), "error": str(e)})
+        return None
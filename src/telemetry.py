@@ -0,0 +1,265 @@
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import secrets
+import sys
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+
+import requests
+
+from src import config
+
+# Structured logging + lightweight tracing.
+#
+# Logs: callers only put records on an in-memory queue (QueueHandler); a background
+# thread formats them as JSON lines that Cloud Logging understands (severity, trace, spanId).
+# Traces: span() context managers carry trace/request/campaign ids through contextvars, so
+# the parallel Gemini calls inside one audit all land in the same trace. Finished spans are
+# exported off the hot path to a JSONL file and/or an OTLP/HTTP collector.
+
+_context = contextvars.ContextVar("trace_context", default=None)
+
+_STANDARD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "taskName"}
+
+_listener = None
+_exporter = None
+
+
+def _sampled(trace_id, rate):
+    """Deterministic per trace, so a sampled trace keeps all of its logs/spans."""
+    if rate >= 1:
+        return True
+    if not trace_id:
+        return secrets.randbelow(10_000) < rate * 10_000
+    return zlib.crc32(trace_id.encode()) % 10_000 < rate * 10_000
+
+
+# --- Trace context ---
+
+def new_trace(request_id=None, campaign_id=None, trace_id=None):
+    """Starts a new trace in the current context (one per HTTP request / bulk job item)."""
+    ctx = {
+        "trace_id": trace_id or secrets.token_hex(16),
+        "span_id": None,
+        "request_id": request_id or secrets.token_hex(8),
+        "campaign_id": campaign_id,
+    }
+    _context.set(ctx)
+    return ctx
+
+
+def current_context():
+    """Serializable trace context, e.g. to continue a trace in a worker process."""
+    return dict(_context.get() or {})
+
+
+def attach(ctx):
+    _context.set(dict(ctx) if ctx else None)
+
+
+def set_campaign(campaign_id):
+    ctx = _context.get()
+    if ctx is not None and campaign_id:
+        _context.set({**ctx, "campaign_id": campaign_id})
+
+
+@contextmanager
+def span(name, **attributes):
+    """Times a block as a child of the current span. Works in sync and async code."""
+    parent = _context.get() or new_trace()
+    span_id = secrets.token_hex(8)
+    token = _context.set({**parent, "span_id": span_id})
+    record = {
+        "name": name,
+        "trace_id": parent["trace_id"],
+        "span_id": span_id,
+        "parent_span_id": parent.get("span_id"),
+        "request_id": parent.get("request_id"),
+        "campaign_id": parent.get("campaign_id"),
+        "start_ns": time.time_ns(),
+        "attributes": attributes,
+        "status": "ok",
+    }
+    try:
+        yield record["attributes"]
+    except BaseException as e:
+        record["status"] = "error"
+        record["error"] = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        _context.reset(token)
+        record["end_ns"] = time.time_ns()
+        if _exporter is not None and _sampled(record["trace_id"], config.TRACE_SAMPLE_RATE):
+            _exporter.export(record)
+
+
+# --- Logging ---
+
+class _ContextFilter(logging.Filter):
+    """Runs in the caller: copies trace ids onto the record and applies sampling."""
+
+    def filter(self, record):
+        ctx = _context.get() or {}
+        record.trace_id = ctx.get("trace_id")
+        record.span_id = ctx.get("span_id")
+        record.request_id = ctx.get("request_id")
+        record.campaign_id = ctx.get("campaign_id")
+        # Warnings and errors are always kept
+        return record.levelno >= logging.WARNING or _sampled(record.trace_id, config.LOG_SAMPLE_RATE)
+
+
+# Added to every record by _ContextFilter
+_CONTEXT_ATTRS = ("trace_id", "span_id", "request_id", "campaign_id")
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, using the field names Cloud Logging picks up."""
+
+    def format(self, record):
+        entry = {
+            "severity": record.levelname,
+            "message": record.getMessage(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            "logger": record.name,
+        }
+        if getattr(record, "trace_id", None):
+            project = config.GOOGLE_CLOUD_PROJECT
+            entry["logging.googleapis.com/trace"] = f"projects/{project}/traces/{record.trace_id}" if project else record.trace_id
+            if record.span_id:
+                entry["logging.googleapis.com/spanId"] = record.span_id
+        for key in ("request_id", "campaign_id"):
+            if getattr(record, key, None):
+                entry[key] = getattr(record, key)
+        # Anything passed via extra={...}; context ids are set (or left out) above
+        for key, value in vars(record).items():
+            if key not in _STANDARD_ATTRS and key not in entry and key not in _CONTEXT_ATTRS:
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def setup_logging():
+    """Routes the "choice" loggers through a queue to a JSON stdout writer thread (idempotent)."""
+    global _listener, _exporter
+    if _listener is not None:
+        return
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    queue_handler.addFilter(_ContextFilter())
+
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(JsonFormatter())
+    _listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+
+    root = logging.getLogger("choice")
+    root.setLevel(config.LOG_LEVEL)
+    root.addHandler(queue_handler)
+    root.propagate = False
+
+    if config.TRACE_EXPORT_FILE or config.TRACE_OTLP_ENDPOINT:
+        _exporter = SpanExporter(config.TRACE_EXPORT_FILE, config.TRACE_OTLP_ENDPOINT)
+
+    atexit.register(shutdown_telemetry)
+
+
+def shutdown_telemetry():
+    global _listener, _exporter
+    if _exporter is not None:
+        _exporter.stop()
+        _exporter = None
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def get_logger(name):
+    return logging.getLogger(f"choice.{name}")
+
+
+# --- Span export ---
+
+def _otlp_span(record):
+    return {
+        "traceId": record["trace_id"],
+        "spanId": record["span_id"],
+        "parentSpanId": record["parent_span_id"] or "",
+        "name": record["name"],
+        "kind": 1,
+        "startTimeUnixNano": str(record["start_ns"]),
+        "endTimeUnixNano": str(record["end_ns"]),
+        "attributes": [
+            {"key": key, "value": {"stringValue": str(value)}}
+            for key, value in {
+                **record["attributes"],
+                "request_id": record["request_id"],
+                "campaign_id": record["campaign_id"],
+                "error": record.get("error"),
+            }.items() if value is not None
+        ],
+        "status": {"code": 2 if record["status"] == "error" else 1},
+    }
+
+
+class SpanExporter:
+    """Batches finished spans on a background thread to a JSONL file and/or OTLP/HTTP (JSON)."""
+
+    def __init__(self, file_path=None, otlp_endpoint=None, batch_size=100, interval=2.0):
+        self.file_path = file_path
+        self.otlp_endpoint = otlp_endpoint
+        self.batch_size = batch_size
+        self.interval = interval
+        self._queue = queue.SimpleQueue()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="span-exporter", daemon=True)
+        self._thread.start()
+
+    def export(self, record):
+        self._queue.put(record)
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join(timeout=5)
+
+    def _run(self):
+        while not self._stopped.is_set() or not self._queue.empty():
+            batch = []
+            deadline = time.monotonic() + self.interval
+            while len(batch) < self.batch_size and time.monotonic() < deadline:
+                try:
+                    batch.append(self._queue.get(timeout=0.2))
+                except queue.Empty:
+                    if self._stopped.is_set():
+                        break
+            if batch:
+                self._flush(batch)
+
+    def _flush(self, batch):
+        if self.file_path:
+            try:
+                with open(self.file_path, "a", encoding="utf-8") as f:
+                    for record in batch:
+                        f.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+            except OSError as e:
+                print(f"Span export to {self.file_path} failed: {e}", file=sys.stderr)
+        if self.otlp_endpoint:
+            payload = {"resourceSpans": [{
+                "resource": {"attributes": [
+                    {"key": "service.name", "value": {"stringValue": config.TRACE_SERVICE_NAME}},
+                    {"key": "process.pid", "value": {"stringValue": str(os.getpid())}},
+                ]},
+                "scopeSpans": [{"scope": {"name": "src.telemetry"}, "spans": [_otlp_span(r) for r in batch]}],
+            }]}
+            try:
+                requests.post(self.otlp_endpoint, json=payload, timeout=5)
+            except requests.RequestException as e:
+                print(f"Span export to {self.otlp_endpoint} failed: {e}", file=sys.stderr)
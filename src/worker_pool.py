@@ -0,0 +1,163 @@
+import asyncio
+import atexit
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from playwright.async_api import async_playwright
+
+from src import config
+from src.resources import cpu_limit
+from src.scraper import scrape_site
+from src.telemetry import attach, current_context, get_logger, setup_logging, span
+
+log = get_logger("worker_pool")
+
+# --- Worker side: each process keeps its own event loop and Chromium ---
+
+_loop = None
+_playwright = None
+_browser = None
+
+
+def _init_worker():
+    global _loop
+    _loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(_loop)
+    setup_logging()
+    atexit.register(_close_worker)
+
+
+def _close_worker():
+    try:
+        if _browser is not None:
+            _loop.run_until_complete(_browser.close())
+        if _playwright is not None:
+            _loop.run_until_complete(_playwright.stop())
+    except Exception:
+        pass
+
+
+async def _get_browser():
+    global _playwright, _browser
+    if _browser is None or not _browser.is_connected():
+        if _playwright is None:
+            _playwright = await async_playwright().start()
+        _browser = await _playwright.chromium.launch(headless=True)
+    return _browser
+
+
+async def _scrape(url, trace_context):
+    # Continue the caller's trace, so worker spans nest under the API request
+    attach(trace_context)
+    with span("scrape.worker", url=url, pid=os.getpid()):
+        return await scrape_site(url, await _get_browser())
+
+
+def _scrape_job(url, trace_context=None):
+    return _loop.run_until_complete(_scrape(url, trace_context))
+
+
+# --- API side ---
+
+class ScrapePool:
+    """
+    Runs scrape_site() in worker processes so browser work never competes with
+    the API event loop. Every worker is its own single-process executor and runs
+    one job at a time, so a URL that kills Chromium breaks only its own worker:
+    that worker is replaced and only that job is retried once. A job running
+    longer than job_timeout has its worker killed and replaced. At most
+    workers + max_pending jobs are accepted at once; further callers wait.
+    """
+
+    def __init__(self, workers_per_core=None, max_pending=None, jobs_per_worker=None, job_timeout=None):
+        per_core = config.SCRAPE_WORKERS_PER_CORE if workers_per_core is None else workers_per_core
+        self.workers = max(1, round(cpu_limit() * per_core)) if per_core > 0 else 0
+        self.max_pending = config.SCRAPE_MAX_PENDING if max_pending is None else max_pending
+        self.jobs_per_worker = config.SCRAPE_JOBS_PER_WORKER if jobs_per_worker is None else jobs_per_worker
+        self.job_timeout = config.SCRAPE_JOB_TIMEOUT if job_timeout is None else job_timeout
+        self.restarts = 0
+        self.timeouts = 0
+        self.in_flight = 0
+        self._executors = []
+        self._idle = asyncio.Queue()
+        self._slots = asyncio.Semaphore(max(1, self.workers) + self.max_pending)
+
+    def _new_executor(self):
+        return ProcessPoolExecutor(
+            max_workers=1,
+            # Playwright is not fork-safe
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            # Recycle the worker periodically so Chromium memory growth stays bounded
+            max_tasks_per_child=self.jobs_per_worker or None,
+        )
+
+    def start(self):
+        if self.workers and not self._executors:
+            self._executors = [self._new_executor() for _ in range(self.workers)]
+            for executor in self._executors:
+                self._idle.put_nowait(executor)
+            log.info("Scrape pool started", extra={"workers": self.workers})
+
+    def shutdown(self):
+        for executor in self._executors:
+            executor.shutdown(wait=False, cancel_futures=True)
+        self._executors = []
+        self._idle = asyncio.Queue()
+
+    def _replace(self, executor, kill=False):
+        if kill:
+            # A hung job never returns on its own; the executor only exposes its process here
+            for process in list((executor._processes or {}).values()):
+                process.kill()
+        executor.shutdown(wait=False, cancel_futures=True)
+        replacement = self._new_executor()
+        if executor in self._executors:
+            self._executors[self._executors.index(executor)] = replacement
+        return replacement
+
+    async def scrape(self, url: str):
+        if not self.workers:
+            try:
+                return await asyncio.wait_for(scrape_site(url), self.job_timeout)
+            except asyncio.TimeoutError:
+                self.timeouts += 1
+                log.error("Scrape timed out", extra={"url": url, "timeout_s": self.job_timeout})
+                return None
+
+        async with self._slots:
+            self.start()
+            executor = await self._idle.get()
+            self.in_flight += 1
+            try:
+                for _ in range(2):
+                    future = executor.submit(_scrape_job, url, current_context())
+                    try:
+                        return await asyncio.wait_for(asyncio.wrap_future(future), self.job_timeout)
+                    except BrokenProcessPool:
+                        self.restarts += 1
+                        log.error("Scrape worker crashed, restarting it", extra={"url": url, "restarts": self.restarts})
+                        executor = self._replace(executor)
+                    except asyncio.TimeoutError:
+                        self.timeouts += 1
+                        log.error("Scrape timed out, killing its worker", extra={"url": url, "timeout_s": self.job_timeout})
+                        executor = self._replace(executor, kill=True)
+                        return None
+                log.error("Error scraping URL: worker crashed twice", extra={"url": url})
+                return None
+            finally:
+                self.in_flight -= 1
+                if executor in self._executors:
+                    self._idle.put_nowait(executor)
+
+    def stats(self):
+        return {
+            "workers": self.workers,
+            "idle_workers": self._idle.qsize(),
+            "in_flight": self.in_flight,
+            "max_pending": self.max_pending,
+            "restarts": self.restarts,
+            "timeouts": self.timeouts,
+        }
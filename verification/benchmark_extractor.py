@@ -0,0 +1,58 @@
+import glob
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from src import config
+from src.extractor import extract_fields
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures", "extractor")
+FIELDS = ["director", "email", "phone", "deadline", "tuition", "open_day", "facilities"]
+
+
+def _same(a, b):
+    return str(a).strip().lower() == str(b).strip().lower()
+
+
+def benchmark_extractor(min_confidence=config.EXTRACT_MIN_CONFIDENCE):
+    # Per field: true positives, false positives (wrong or spurious), false negatives (missed)
+    stats = {f: {"tp": 0, "fp": 0, "fn": 0} for f in FIELDS}
+
+    for path in sorted(glob.glob(os.path.join(FIXTURES, "*.json"))):
+        with open(path, encoding="utf-8") as f:
+            page = json.load(f)
+
+        found = {
+            field: hit["value"] for field, hit in extract_fields(page["scraped"]).items()
+            if hit["confidence"] >= min_confidence
+        }
+        for field in FIELDS:
+            expected = page["expected"].get(field)
+            got = found.get(field)
+            if got is not None and expected is not None and _same(got, expected):
+                stats[field]["tp"] += 1
+                continue
+            if got is not None:
+                stats[field]["fp"] += 1
+                print(f"  {os.path.basename(path)}: {field} = {got!r} (expected {expected!r})")
+            if expected is not None:
+                stats[field]["fn"] += 1
+
+    print(f"\n{'field':<12}{'precision':>10}{'recall':>10}   (min confidence {min_confidence})")
+    total = {"tp": 0, "fp": 0, "fn": 0}
+    for field, s in stats.items():
+        for k in total:
+            total[k] += s[k]
+        print(f"{field:<12}{_ratio(s['tp'], s['tp'] + s['fp']):>10}{_ratio(s['tp'], s['tp'] + s['fn']):>10}")
+    print(f"{'ALL':<12}{_ratio(total['tp'], total['tp'] + total['fp']):>10}{_ratio(total['tp'], total['tp'] + total['fn']):>10}")
+    return stats
+
+
+def _ratio(num, den):
+    return f"{num / den:.2f}" if den else "-"
+
+
+if __name__ == "__main__":
+    benchmark_extractor(float(sys.argv[1]) if len(sys.argv) > 1 else config.EXTRACT_MIN_CONFIDENCE)